@@ -0,0 +1,114 @@
+from utils import np
+from detector import slab_intervals, ray_box_intersections
+
+
+class UniformGrid:
+    # Равномерная сетка над AABB детекторов с обходом 3D-DDA (Amanatides & Woo).
+    # Каждый луч посещает только ячейки вдоль своего пути, поэтому стоимость
+    # растет с числом пересекаемых ячеек, а не с общим числом детекторов.
+    def __init__(self, box_min, box_max, cell_size=None, max_cells_per_box=8):
+        self.box_min = np.asarray(box_min, dtype=float)
+        self.box_max = np.asarray(box_max, dtype=float)
+        if self.box_min.shape != self.box_max.shape or self.box_min.ndim != 2 or self.box_min.shape[1] != 3:
+            raise ValueError("Границы детекторов должны иметь размерность (M, 3)")
+        count = len(self.box_min)
+        if count == 0:
+            raise ValueError("Сетка требует хотя бы один детектор")
+
+        self.lower = self.box_min.min(axis=0)
+        self.upper = self.box_max.max(axis=0)
+        extent = np.maximum(self.upper - self.lower, 1e-12)
+        if cell_size is None:
+            cell_size = float(np.median(np.max(self.box_max - self.box_min, axis=1)))
+        resolution = np.clip(np.ceil(extent / max(cell_size, 1e-12)), 1, None).astype(np.int64)
+        while np.prod(resolution) > max_cells_per_box * count and np.any(resolution > 1):
+            resolution = np.maximum(resolution // 2, 1)
+        self.resolution = resolution
+        self.cell_size = extent / resolution
+
+        # Коробки регистрируются с небольшим запасом, чтобы лучи, идущие точно
+        # по границе ячеек, не теряли детекторы из-за округления.
+        margin = 1e-9 * float(np.max(extent))
+        first = self.cell_of(self.box_min - margin)
+        last = self.cell_of(self.box_max + margin)
+        cells, boxes = [], []
+        for index, (lo, hi) in enumerate(zip(first, last)):
+            grid = np.stack(np.meshgrid(*[np.arange(l, h + 1) for l, h in zip(lo, hi)], indexing='ij'), axis=-1)
+            flat = self.flat_index(grid.reshape(-1, 3))
+            cells.append(flat)
+            boxes.append(np.full(len(flat), index, dtype=np.int64))
+        cells = np.concatenate(cells)
+        boxes = np.concatenate(boxes)
+        order = np.argsort(cells, kind='stable')
+        self.cell_boxes = boxes[order]
+        self.cell_start = np.searchsorted(cells[order], np.arange(np.prod(self.resolution) + 1))
+
+    def cell_of(self, points):
+        cells = np.floor((points - self.lower) / self.cell_size).astype(np.int64)
+        return np.clip(cells, 0, self.resolution - 1)
+
+    def flat_index(self, cells):
+        return (cells[..., 0] * self.resolution[1] + cells[..., 1]) * self.resolution[2] + cells[..., 2]
+
+    def candidates(self, origins, directions):
+        # Возвращает уникальные пары (луч, детектор), упорядоченные по лучу и детектору.
+        origins = np.asarray(origins, dtype=float)
+        directions = np.asarray(directions, dtype=float)
+        t_near, t_far, outside = slab_intervals(origins, directions, self.lower, self.upper)
+        t_start = np.maximum(t_near, 0.0)
+        # Луч, параллельный всем осям (в том числе нулевое направление), не продвигается по сетке
+        # и не пересекает ни одного детектора, как и в расчете по парам.
+        moving = np.any(np.abs(directions) >= 1e-8, axis=-1)
+        rays = np.nonzero(~outside & moving & (t_start <= t_far))[0]
+
+        o = origins[rays]
+        d = directions[rays]
+        t_exit = t_far[rays]
+        cell = self.cell_of(o + d * t_start[rays, None])
+        parallel = np.abs(d) < 1e-8
+        step = np.where(parallel, 0, np.sign(d)).astype(np.int64)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t_delta = np.where(parallel, np.inf, self.cell_size / np.abs(d))
+            boundary = self.lower + (cell + (step > 0)) * self.cell_size
+            t_next = np.where(parallel, np.inf, (boundary - o) / d)
+
+        visited_rays, visited_cells = [], []
+        while len(rays):
+            visited_rays.append(rays)
+            visited_cells.append(self.flat_index(cell))
+            rows = np.arange(len(rays))
+            axis = np.argmin(t_next, axis=1)
+            t_leave = t_next[rows, axis]
+            cell[rows, axis] += step[rows, axis]
+            t_next[rows, axis] += t_delta[rows, axis]
+            keep = (t_leave <= t_exit) & np.all((cell >= 0) & (cell < self.resolution), axis=1)
+            rays, cell, step, t_delta, t_next, t_exit = (
+                rays[keep], cell[keep], step[keep], t_delta[keep], t_next[keep], t_exit[keep]
+            )
+
+        if not visited_rays:
+            empty = np.empty(0, dtype=np.int64)
+            return empty, empty
+        rays = np.concatenate(visited_rays)
+        cells = np.concatenate(visited_cells)
+        counts = self.cell_start[cells + 1] - self.cell_start[cells]
+        offsets = np.repeat(self.cell_start[cells] - (np.cumsum(counts) - counts), counts) + np.arange(counts.sum())
+        count = len(self.box_min)
+        keys = np.unique(np.repeat(rays, counts) * count + self.cell_boxes[offsets])
+        return keys // count, keys % count
+
+    def query(self, origins, directions):
+        # Пары (луч, детектор) с фактическим пересечением, для каждого луча в порядке входа.
+        origins = np.asarray(origins, dtype=float)
+        directions = np.asarray(directions, dtype=float)
+        ray_idx, box_idx = self.candidates(origins, directions)
+        hit, t_near, t_far = ray_box_intersections(
+            origins[ray_idx], directions[ray_idx], self.box_min[box_idx], self.box_max[box_idx]
+        )
+        ray_idx, box_idx, t_near, t_far = ray_idx[hit], box_idx[hit], t_near[hit], t_far[hit]
+        order = np.lexsort((t_near, ray_idx))
+        return ray_idx[order], box_idx[order], t_near[order], t_far[order]
+
+    def query_ray(self, origin, direction):
+        _, box_idx, t_near, t_far = self.query(np.reshape(origin, (1, 3)), np.reshape(direction, (1, 3)))
+        return box_idx, t_near, t_far
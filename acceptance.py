@@ -0,0 +1,127 @@
+import os
+import copy
+import hashlib
+from utils import np
+from accel import UniformGrid
+from log import get_logger
+from config import ACCEPTANCE_BINS, ACCEPTANCE_SUBSAMPLES, ACCEPTANCE_CACHE_DIR, ACCEPTANCE_POSITION_STEP
+
+logger = get_logger(__name__)
+
+# Таблица строится в системе координат матрицы и зависит только от положения генератора
+# в этой системе. Положение округляется до узла сетки с шагом ACCEPTANCE_POSITION_STEP,
+# поэтому движущаяся матрица не требует новой таблицы на каждом шаге.
+
+
+def local_origin(origin, matrix, step=ACCEPTANCE_POSITION_STEP):
+    origins, _ = matrix.to_local(np.asarray(origin, dtype=float)[None], np.zeros((1, 3)))
+    return np.round(origins[0] / step) * step if step > 0 else np.array(origins[0], dtype=float)
+
+
+def acceptance_key(origin, matrix, bins=ACCEPTANCE_BINS, subsamples=ACCEPTANCE_SUBSAMPLES, step=ACCEPTANCE_POSITION_STEP):
+    digest = hashlib.sha1()
+    for array in (local_origin(origin, matrix, step), matrix.box_min, matrix.box_max, [step]):
+        digest.update(np.ascontiguousarray(array, dtype=float).tobytes())
+    digest.update(np.array([*bins, subsamples], dtype=np.int64).tobytes())
+    return digest.hexdigest()
+
+
+class AcceptanceTable:
+    # Таблица геометрического аксептанса: доля каждой ячейки сетки направлений
+    # (cos полярного угла x азимут, ячейки равной площади), попадающая в каждый детектор.
+    def __init__(self, acceptance, coverage, bins):
+        self.acceptance = np.asarray(acceptance, dtype=float)
+        self.coverage = np.asarray(coverage, dtype=float)
+        self.bins = tuple(int(b) for b in bins)
+        self.total = float(self.coverage.mean())
+        # Поворот матрицы: направления разыгрываются в её системе координат и переводятся в мировую.
+        self.rotation = None
+
+    def oriented(self, matrix):
+        table = copy.copy(self)
+        table.rotation = None if matrix.tilt == 0 else matrix.rotation.copy()
+        return table
+
+    @classmethod
+    def build(cls, origin, matrix, bins=ACCEPTANCE_BINS, subsamples=ACCEPTANCE_SUBSAMPLES, step=ACCEPTANCE_POSITION_STEP):
+        n_cos, n_phi = bins
+        if n_phi % 2:
+            raise ValueError("Число азимутальных ячеек должно быть четным")
+        n_bins = n_cos * n_phi
+        per_bin = subsamples * subsamples
+        offsets = (np.arange(subsamples) + 0.5) / subsamples
+        cos_theta = -1 + (np.arange(n_cos)[:, None, None, None] + offsets[None, None, :, None]) * (2 / n_cos)
+        azimuth = (np.arange(n_phi)[None, :, None, None] + offsets[None, None, None, :]) * (2 * np.pi / n_phi)
+        cos_theta, azimuth = np.broadcast_arrays(cos_theta, azimuth)
+        sin_theta = np.sqrt(1 - cos_theta ** 2)
+        directions = np.stack([sin_theta * np.cos(azimuth), sin_theta * np.sin(azimuth), cos_theta], axis=-1).reshape(-1, 3)
+
+        # Аксептанс считается по точным коробкам из узла. Для покрытия, по которому разыгрываются
+        # направления, коробки расширяются на половину шага округления: направление, попадающее
+        # в детектор из любой точки ячейки вокруг узла, попадает из узла в расширенную коробку,
+        # поэтому выборка не обнуляет направления, видимые из истинного положения генератора.
+        origins = np.broadcast_to(local_origin(origin, matrix, step), directions.shape)
+        ray_idx, box_idx, _, _ = UniformGrid(matrix.box_min, matrix.box_max).query(origins, directions)
+        counts = np.zeros((n_bins, len(matrix.box_min)))
+        np.add.at(counts, (ray_idx // per_bin, box_idx), 1)
+
+        margin = step / 2
+        if margin > 0:
+            ray_idx, _, _, _ = UniformGrid(matrix.box_min - margin, matrix.box_max + margin).query(origins, directions)
+        any_hit = np.zeros(len(directions), dtype=bool)
+        any_hit[ray_idx] = True
+        return cls(counts / per_bin, any_hit.reshape(n_bins, per_bin).mean(axis=1), bins)
+
+    @classmethod
+    def cached(cls, origin, matrix, bins=ACCEPTANCE_BINS, subsamples=ACCEPTANCE_SUBSAMPLES, step=ACCEPTANCE_POSITION_STEP,
+               cache_dir=ACCEPTANCE_CACHE_DIR):
+        path = os.path.join(cache_dir, f'{acceptance_key(origin, matrix, bins, subsamples, step)}.npz')
+        if os.path.exists(path):
+            return cls.load(path)
+        table = cls.build(origin, matrix, bins, subsamples, step)
+        try:
+            table.save(path)
+        except PermissionError as e:
+            logger.error("Ошибка записи файла %s: Отказано в доступе (%s). Таблица аксептанса не сохранена.", path, e)
+        return table
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data['acceptance'], data['coverage'], data['bins'])
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, acceptance=self.acceptance, coverage=self.coverage, bins=np.array(self.bins))
+        os.replace(tmp_path, path)
+
+    def expected_counts(self, num_particles):
+        return num_particles * self.acceptance.mean(axis=0)
+
+    def antipodal_coverage(self):
+        n_cos, n_phi = self.bins
+        coverage = self.coverage.reshape(n_cos, n_phi)[::-1]
+        return np.roll(coverage, n_phi // 2, axis=1).reshape(-1)
+
+    def sample_angles(self, rng, count, paired=False):
+        # Направления разыгрываются только в ячейках, видящих хотя бы один детектор
+        # (для пар нейтрон-альфа - в прямом или обратном направлении).
+        # Вес частицы - отношение изотропной плотности к плотности выборки.
+        proposal = np.maximum(self.coverage, self.antipodal_coverage()) if paired else self.coverage
+        if not np.any(proposal):
+            raise ValueError("Ни одно направление не попадает в детекторы")
+        n_cos, n_phi = self.bins
+        cells = rng.choice(len(proposal), size=count, p=proposal / proposal.sum())
+        u, v = rng.random((2, count))
+        cos_theta = -1 + (cells // n_phi + u) * (2 / n_cos)
+        azimuth = (cells % n_phi + v) * (2 * np.pi / n_phi)
+        weights = proposal.mean() / proposal[cells]
+        if self.rotation is None:
+            return azimuth, np.arccos(np.clip(cos_theta, -1, 1)), weights
+        sin_theta = np.sqrt(1 - cos_theta ** 2)
+        directions = np.stack([sin_theta * np.cos(azimuth), sin_theta * np.sin(azimuth), cos_theta], axis=-1)
+        directions = directions @ self.rotation.T
+        azimuth = np.mod(np.arctan2(directions[:, 1], directions[:, 0]), 2 * np.pi)
+        return azimuth, np.arccos(np.clip(directions[:, 2], -1, 1)), weights
@@ -0,0 +1,125 @@
+import os
+import sys
+import itertools
+from time import perf_counter
+from datetime import datetime
+from multiprocessing import get_context
+from concurrent.futures import ProcessPoolExecutor
+import config
+from log import get_logger
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+logger = get_logger(__name__)
+
+# Набор по умолчанию: число нейтронов за шаг (альфа-частиц вдвое меньше), размер матрицы n x n,
+# длительность прогона в секундах. Зерно фиксировано, чтобы прогоны были сопоставимы между версиями.
+BENCH_PARTICLES = (10, 100, 1000)
+BENCH_GRIDS = (4, 6, 32)
+BENCH_DURATIONS = (1.0, 10.0)
+BENCH_SEED = 12345
+
+BENCH_COLUMNS = [
+    'name', 'neutrons', 'alphas', 'grid', 'duration', 'steps', 'particles', 'hits',
+    'seconds', 'particles_per_s', 'hits_per_s', 'peak_memory_mb',
+]
+
+
+def grid_positions(n, size=None, z=0.8):
+    size = config.DETECTOR_SIZE if size is None else size
+    offset = (n - 1) * size / 2
+    return [(x * size - offset, y * size - offset, z) for x in range(n) for y in range(n)]
+
+
+def bench_cases(particles=BENCH_PARTICLES, grids=BENCH_GRIDS, durations=BENCH_DURATIONS):
+    cases = []
+    for neutrons, grid, duration in itertools.product(particles, grids, durations):
+        cases.append({
+            'name': f'n{neutrons}_g{grid}x{grid}_t{duration:g}',
+            'neutrons': neutrons,
+            'alphas': neutrons // 2,
+            'grid': grid,
+            'duration': duration,
+        })
+    return cases
+
+
+def peak_memory_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux возвращает килобайты, macOS - байты.
+    return peak / 1024 ** 2 if sys.platform == 'darwin' else peak / 1024
+
+
+def _run_case(case, seed, timestamp, plots):
+    # Выполняется в отдельном процессе: параметры config.py подменяются до импорта симуляции,
+    # а пиковая память процесса относится только к этому случаю.
+    config.NUM_NEUTRONS = case['neutrons']
+    config.NUM_ALPHAS = case['alphas']
+    config.DETECTOR_POSITIONS = grid_positions(case['grid'])
+    config.DETECTOR_GRID_SIZE = (case['grid'], case['grid'])
+    config.SIMULATION_TIME = case['duration']
+    import log
+    log.set_level('WARNING')
+    from simulation import Simulation
+
+    sim = Simulation(seed=seed, profile=True)
+    start = perf_counter()
+    sim.run(workers=1, timestamp=timestamp)
+    seconds = perf_counter() - start
+    sim.export_results(f'results_{timestamp}.npz', timestamp)
+    if plots:
+        from visualization import visualize_angular_distribution
+        with sim.timer.stage('plot'):
+            visualize_angular_distribution(sim.histogram, timestamp)
+        sim.write_timing(timestamp)
+
+    particles = sim.num_steps() * (case['neutrons'] + case['alphas'])
+    hits = sim.counters.total
+    return dict(
+        case,
+        steps=sim.num_steps(),
+        particles=particles,
+        hits=hits,
+        seconds=seconds,
+        particles_per_s=particles / seconds if seconds else float('inf'),
+        hits_per_s=hits / seconds if seconds else float('inf'),
+        peak_memory_mb=peak_memory_mb(),
+    )
+
+
+def run_benchmark(cases=None, seed=BENCH_SEED, plots=False):
+    cases = bench_cases() if cases is None else cases
+    bench_timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+    context = get_context('spawn')
+    rows = []
+    for case in cases:
+        timestamp = f'bench_{bench_timestamp}_{case["name"]}'
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+            row = executor.submit(_run_case, case, seed, timestamp, plots).result()
+        rows.append(row)
+        logger.info(
+            "%s: %d частиц, %d пересечений за %.3f с - %.0f частиц/с, %.0f пересечений/с, пик памяти %s МБ",
+            row['name'], row['particles'], row['hits'], row['seconds'], row['particles_per_s'], row['hits_per_s'],
+            'н/д' if row['peak_memory_mb'] is None else f"{row['peak_memory_mb']:.1f}"
+        )
+    path = write_report(rows, os.path.join('history', f'bench_{bench_timestamp}', f'benchmark_{bench_timestamp}.csv'))
+    logger.info("Отчет бенчмарка сохранен в %s", path)
+    return rows
+
+
+def write_report(rows, path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', newline='', encoding='utf-8-sig') as f:
+        f.write(';'.join(BENCH_COLUMNS) + '\n')
+        for row in rows:
+            f.write(';'.join('' if row[name] is None else str(row[name]) for name in BENCH_COLUMNS) + '\n')
+    return path
+
+
+if __name__ == '__main__':
+    run_benchmark()
@@ -0,0 +1,110 @@
+import os
+import glob
+import json
+from utils import np
+import config
+
+# Контрольные точки прогона: history/<timestamp>/checkpoints/[part<n>/]checkpoint_<k>.npz.
+# Каждый файл содержит номер следующего шага и только данные, накопленные после
+# предыдущей точки; состояние восстанавливается последовательным применением всех файлов.
+MANIFEST_NAME = 'run.json'
+
+# Параметры config.py, от которых зависят результаты прогона. Общий список для
+# проверки продолжения прогона и для ключа кэша сканирования (sweep.py).
+RESULT_CONFIG_KEYS = [
+    'DETECTOR_SIZE', 'DETECTOR_POSITIONS', 'GENERATOR_POSITION',
+    'GENERATOR_PULSE_DISTRIBUTION', 'GENERATOR_PULSE_MEAN', 'GENERATOR_PULSE_STD',
+    'GENERATOR_PULSE_UNIFORM_MIN', 'GENERATOR_PULSE_UNIFORM_MAX',
+    'NUM_NEUTRONS', 'NUM_ALPHAS', 'MIN_TRACK_LENGTH', 'SIMULATION_TIME', 'TIME_STEP', 'PARTICLE_SPEED',
+    'TRAJECTORY_START', 'TRAJECTORY_VELOCITY', 'TRAJECTORY_TILT_AXIS', 'TRAJECTORY_TILT_START', 'TRAJECTORY_TILT_RATE',
+    'ACCEPTANCE_SAMPLING', 'ACCEPTANCE_BINS', 'ACCEPTANCE_SUBSAMPLES', 'ACCEPTANCE_POSITION_STEP',
+    'STREAMING_RESULTS', 'STREAMING_FORMAT', 'DIAGNOSTICS_FORMAT', 'ANGULAR_HISTOGRAM_BINS',
+]
+
+
+def run_config():
+    # Все параметры config.py, кроме функций и модулей; значения приводятся к виду
+    # после json, чтобы их можно было сравнить с манифестом.
+    values = {
+        key: value for key, value in vars(config).items()
+        if key.isupper() and not callable(value)
+    }
+    return json.loads(json.dumps(values, default=list))
+
+
+def result_config(values=None):
+    values = run_config() if values is None else values
+    return {key: values.get(key) for key in RESULT_CONFIG_KEYS}
+
+
+def config_mismatch(recorded):
+    current = result_config()
+    recorded = result_config(recorded)
+    return [key for key in RESULT_CONFIG_KEYS if current[key] != recorded[key]]
+
+
+def checkpoint_dir(timestamp, part=None):
+    path = os.path.join('history', timestamp, 'checkpoints')
+    return path if part is None else os.path.join(path, f'part{part}')
+
+
+def flatten_state(state, prefix=''):
+    flat = {}
+    for key, value in state.items():
+        if isinstance(value, dict):
+            flat.update(flatten_state(value, f'{prefix}{key}.'))
+        else:
+            flat[f'{prefix}{key}'] = value
+    return flat
+
+
+def unflatten_state(flat):
+    state = {}
+    for key, value in flat.items():
+        *path, name = key.split('.')
+        node = state
+        for part in path:
+            node = node.setdefault(part, {})
+        node[name] = value
+    return state
+
+
+class CheckpointStore:
+    def __init__(self, directory):
+        self.directory = directory
+        self.index = len(self.paths())
+
+    def paths(self):
+        return sorted(glob.glob(os.path.join(self.directory, 'checkpoint_*.npz')))
+
+    def clear(self):
+        for path in self.paths():
+            os.remove(path)
+        self.index = 0
+
+    def save(self, state):
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f'checkpoint_{self.index:05d}.npz')
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, **flatten_state(state))
+        os.replace(tmp_path, path)
+        self.index += 1
+        return path
+
+    def load(self):
+        for path in self.paths():
+            with np.load(path) as data:
+                yield unflatten_state({key: data[key] for key in data.files})
+
+    def write_manifest(self, manifest):
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, MANIFEST_NAME), 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, default=list)
+
+    def read_manifest(self):
+        path = os.path.join(self.directory, MANIFEST_NAME)
+        if not os.path.exists(path):
+            raise ValueError(f"В {self.directory} нет контрольных точек прогона")
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
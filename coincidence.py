@@ -0,0 +1,136 @@
+import os
+from utils import np
+from particle import PARTICLE_CODES
+from log import get_logger
+from config import COINCIDENCE_WINDOW, COINCIDENCE_BINS, COINCIDENCE_BLOCK_SIZE, COINCIDENCE_PAIR_TYPES
+
+logger = get_logger(__name__)
+
+# Поиск совпадений: детекции сортируются по времени один раз, для каждой детекции
+# граница окна находится бинарным поиском, а пары внутри окна порождаются блоками
+# ограниченного размера. Сложность O(n log n + K), где K - число найденных пар.
+
+
+def type_codes(particle_types):
+    particle_types = np.asarray(particle_types)
+    if particle_types.dtype.kind == 'O':
+        particle_types = particle_types.astype('U7')
+    if particle_types.dtype.kind != 'U':
+        return particle_types.astype(np.int64)
+    codes = np.full(len(particle_types), -1, dtype=np.int64)
+    for name, code in PARTICLE_CODES.items():
+        codes[particle_types == name] = code
+    return codes
+
+
+def window_pairs(times, window, block_size=COINCIDENCE_BLOCK_SIZE):
+    # Пары индексов (i, j), i < j, в отсортированном по времени массиве с t[j] - t[i] <= window.
+    count = len(times)
+    end = np.searchsorted(times, times + window, side='right')
+    after = end - np.arange(count) - 1
+    total = np.cumsum(after)
+    start = 0
+    while start < count:
+        done = total[start - 1] if start else 0
+        stop = max(int(np.searchsorted(total, done + block_size, side='right')), start + 1)
+        counts = after[start:stop]
+        first = np.repeat(np.arange(start, stop), counts)
+        offsets = np.arange(len(first)) - np.repeat(np.cumsum(counts) - counts, counts)
+        yield first, first + 1 + offsets
+        start = stop
+
+
+def build_events(times, detectors, window, num_detectors):
+    # Построитель событий: новое событие начинается, когда пауза между соседними
+    # детекциями превышает окно. Возвращает номер события для каждой детекции
+    # (в исходном порядке) и число различных детекторов в каждом событии.
+    times = np.asarray(times, dtype=float)
+    detectors = np.asarray(detectors, dtype=np.int64)
+    if not len(times):
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    order = np.argsort(times, kind='stable')
+    sorted_event = np.concatenate([[0], np.cumsum(np.diff(times[order]) > window)])
+    event = np.empty_like(sorted_event)
+    event[order] = sorted_event
+    distinct = np.unique(event * num_detectors + detectors)
+    return event, np.bincount(distinct // num_detectors, minlength=int(sorted_event[-1]) + 1)
+
+
+class Coincidences:
+    # Счетчики совпадений по парам детекторов (d1 <= d2) и гистограммы разности времен t(d2) - t(d1).
+    def __init__(self, num_detectors, window=COINCIDENCE_WINDOW, bins=COINCIDENCE_BINS):
+        if window <= 0:
+            raise ValueError("Окно совпадений должно быть положительным")
+        self.num_detectors = num_detectors
+        self.window = float(window)
+        self.edges = np.linspace(-self.window, self.window, bins + 1)
+        self.pairs = np.empty((0, 2), dtype=np.int64)
+        self.counts = np.empty(0, dtype=np.int64)
+        self.hist = np.empty((0, bins), dtype=np.int64)
+        self.multiplicity = np.empty(0, dtype=np.int64)
+
+    @property
+    def total(self):
+        return int(self.counts.sum())
+
+    def count(self, first, second):
+        lo, hi = min(first, second), max(first, second)
+        match = np.nonzero((self.pairs[:, 0] == lo) & (self.pairs[:, 1] == hi))[0]
+        return int(self.counts[match[0]]) if len(match) else 0
+
+    def find(self, columns, pair_types=None, block_size=COINCIDENCE_BLOCK_SIZE):
+        # pair_types - пара типов частиц, например ('neutron', 'alpha'); None - любые пары.
+        if pair_types is not None and (len(pair_types) != 2 or any(name not in PARTICLE_CODES for name in pair_types)):
+            raise ValueError(f"Ожидается пара типов частиц из {', '.join(PARTICLE_CODES)}: {pair_types}")
+        times = np.asarray(columns['time'], dtype=float)
+        detectors = np.asarray(columns['detector'], dtype=np.int64)
+        codes = type_codes(columns['particle_type'])
+        order = np.argsort(times, kind='stable')
+        times, detectors, codes = times[order], detectors[order], codes[order]
+
+        bins = len(self.edges) - 1
+        cells = []
+        for first, second in window_pairs(times, self.window, block_size):
+            if pair_types is not None:
+                a, b = (PARTICLE_CODES[name] for name in pair_types)
+                ca, cb = codes[first], codes[second]
+                keep = ((ca == a) & (cb == b)) | ((ca == b) & (cb == a))
+                first, second = first[keep], second[keep]
+            da, db = detectors[first], detectors[second]
+            dt = np.where(da <= db, 1.0, -1.0) * (times[second] - times[first])
+            pair = np.minimum(da, db) * self.num_detectors + np.maximum(da, db)
+            dt_bin = np.clip(np.searchsorted(self.edges, dt, side='right') - 1, 0, bins - 1)
+            keys, key_counts = np.unique(pair * bins + dt_bin, return_counts=True)
+            cells.append((keys, key_counts))
+
+        if cells:
+            keys = np.concatenate([keys for keys, _ in cells])
+            key_counts = np.concatenate([key_counts for _, key_counts in cells])
+            keys, inverse = np.unique(keys, return_inverse=True)
+            key_counts = np.bincount(inverse.reshape(-1), weights=key_counts, minlength=len(keys)).astype(np.int64)
+            pair_keys, pair_index = np.unique(keys // bins, return_inverse=True)
+            self.pairs = np.stack([pair_keys // self.num_detectors, pair_keys % self.num_detectors], axis=1)
+            self.hist = np.zeros((len(pair_keys), bins), dtype=np.int64)
+            self.hist[pair_index.reshape(-1), keys % bins] = key_counts
+            self.counts = self.hist.sum(axis=1)
+        _, self.multiplicity = build_events(times, detectors, self.window, self.num_detectors)
+        return self
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        np.savez(path, pairs=self.pairs, counts=self.counts, hist=self.hist, edges=self.edges,
+                 multiplicity=self.multiplicity, window=self.window)
+        csv_path = os.path.splitext(path)[0] + '.csv'
+        with open(csv_path, 'w', newline='', encoding='utf-8-sig') as f:
+            f.write('Детектор_1;Детектор_2;Совпадений\n')
+            f.writelines(f'{a};{b};{n}\n' for (a, b), n in zip(self.pairs.tolist(), self.counts.tolist()))
+        return path
+
+
+def find_coincidences(columns, num_detectors, window=COINCIDENCE_WINDOW, bins=COINCIDENCE_BINS, pair_types=COINCIDENCE_PAIR_TYPES):
+    coincidences = Coincidences(num_detectors, window, bins).find(columns, pair_types)
+    logger.info(
+        "Найдено %d совпадений в окне %s с по %d парам детекторов, событий %d",
+        coincidences.total, window, len(coincidences.pairs), len(coincidences.multiplicity)
+    )
+    return coincidences
@@ -1,3 +1,5 @@
+import os
+import json
 import numpy as np
 
 DETECTOR_SIZE = 0.5
@@ -13,9 +15,65 @@ GENERATOR_PULSE_STD = 5.0
 GENERATOR_PULSE_UNIFORM_MIN = -1
 GENERATOR_PULSE_UNIFORM_MAX = 1
 
+RANDOM_SEED = None
+NUM_NEUTRONS = 10
+NUM_ALPHAS = 5
+
 MIN_TRACK_LENGTH = 0.001
 SIMULATION_TIME = 10
+TIME_STEP = 0.1
+WORKERS = 1
 PARTICLE_SPEED = 1.5
 
+TRAJECTORY_START = (0.0, 0.0, 0.0)
+TRAJECTORY_VELOCITY = (0.0, 0.0, 0.0)
+TRAJECTORY_TILT_AXIS = (0.0, 1.0, 0.0)
+TRAJECTORY_TILT_START = 0.0
+TRAJECTORY_TILT_RATE = 0.0
+
+def TRAJECTORY(t):
+    translation = tuple(start + velocity * t for start, velocity in zip(TRAJECTORY_START, TRAJECTORY_VELOCITY))
+    return translation, TRAJECTORY_TILT_START + TRAJECTORY_TILT_RATE * t
+
 DISTANCES = [0.25, 0.5, 0.8, 1.0]
 ANGLES = [0, 30, 60, 90]
+
+DIAGNOSTICS_FORMAT = 'csv'
+DIAGNOSTICS_CHUNK_SIZE = 65536
+
+STREAMING_RESULTS = False
+STREAMING_FORMAT = 'csv'
+ANGULAR_HISTOGRAM_BINS = (100, 100)
+
+ACCEPTANCE_SAMPLING = False
+ACCEPTANCE_BINS = (64, 128)
+ACCEPTANCE_SUBSAMPLES = 4
+ACCEPTANCE_CACHE_DIR = 'cache/acceptance'
+ACCEPTANCE_POSITION_STEP = 0.05
+ACCEPTANCE_MEMORY_TABLES = 8
+
+SWEEP_CACHE_DIR = 'cache/sweep'
+
+PLOT_HEADLESS = True
+PLOT_DPI = 600
+PLOT_WORKERS = 1
+
+LOG_LEVEL = 'INFO'
+LOG_FORMAT = '%(message)s'
+LOG_FILE = None
+LOG_EVENT_LIMIT = 20
+LOG_EVENT_SAMPLE = 1000
+
+PROFILE_STAGES = False
+
+CHECKPOINT_INTERVAL = 0
+
+COINCIDENCE_WINDOW = 0.01
+COINCIDENCE_BINS = 50
+COINCIDENCE_BLOCK_SIZE = 1000000
+COINCIDENCE_PAIR_TYPES = None
+
+# Переопределения параметров из командной строки (main.py) передаются через переменную
+# окружения, чтобы их получали и дочерние процессы. Применяются последними.
+CONFIG_OVERRIDES_ENV = 'DETECTOR_SIM_CONFIG'
+globals().update(json.loads(os.environ.get(CONFIG_OVERRIDES_ENV, '{}')))
@@ -1,7 +1,86 @@
-import os
-import csv
+import logging
 from utils import np
 from config import MIN_TRACK_LENGTH
+from log import get_logger, events
+
+logger = get_logger(__name__)
+
+
+def normalize_directions(directions):
+    directions = np.asarray(directions, dtype=float)
+    norms = np.sqrt(np.sum(directions * directions, axis=-1))
+    valid = norms >= 1e-8
+    with np.errstate(divide='ignore', invalid='ignore'):
+        normalized = directions / np.where(valid, norms, 1.0)[..., None]
+    return normalized, valid
+
+
+def slab_intervals(origins, directions, box_min, box_max):
+    # Все аргументы приводятся по правилам broadcasting, последняя ось - координаты.
+    parallel = np.abs(directions) < 1e-8
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t1 = (box_min - origins) / directions
+        t2 = (box_max - origins) / directions
+    t_min = np.where(parallel, -np.inf, np.minimum(t1, t2))
+    t_max = np.where(parallel, np.inf, np.maximum(t1, t2))
+    outside = np.any(parallel & ((origins < box_min) | (origins > box_max)), axis=-1)
+    return np.max(t_min, axis=-1), np.min(t_max, axis=-1), outside
+
+
+def ray_box_intersections(origins, directions, box_min, box_max):
+    t_near, t_far, outside = slab_intervals(origins, directions, box_min, box_max)
+    hit = ~outside & (t_near <= t_far) & (t_near >= 0)
+    return hit, t_near, t_far
+
+
+def _intersect(origins, directions, valid, times, box_min, box_max, speed):
+    hit, t_near, t_far = ray_box_intersections(origins, directions, box_min, box_max)
+    hit &= valid
+
+    with np.errstate(invalid='ignore'):
+        intersection_point = origins + directions * t_near[..., None]
+        exit_point = origins + directions * t_far[..., None]
+        track_length = np.sqrt(np.sum((exit_point - intersection_point) ** 2, axis=-1))
+        detection_time = times + t_near / speed
+    crossed = hit.copy()
+    hit &= detection_time >= 0
+
+    return {
+        'hit': hit,
+        'crossed': crossed,
+        't_near': t_near,
+        't_far': t_far,
+        'track_length': track_length,
+        'time': detection_time,
+    }
+
+
+def calculate_intersections(origins, directions, times, box_min, box_max, speed):
+    # origins, directions: (N, 3); times: (N,); box_min, box_max: (M, 3).
+    # Возвращает матрицы N x M для всех пар частица-детектор за один проход.
+    origins = np.asarray(origins, dtype=float)
+    times = np.asarray(times, dtype=float)
+    directions, valid = normalize_directions(directions)
+    result = _intersect(
+        origins[:, None, :], directions[:, None, :], valid[:, None], times[:, None],
+        box_min[None, :, :], box_max[None, :, :], speed
+    )
+    result['valid'] = valid
+    result['direction'] = directions
+    return result
+
+
+def calculate_pair_intersections(origins, directions, times, box_min, box_max, speed):
+    # Все массивы выровнены по парам частица-детектор: (K, 3) и (K,).
+    # Дает те же значения, что и соответствующие элементы calculate_intersections.
+    origins = np.asarray(origins, dtype=float)
+    times = np.asarray(times, dtype=float)
+    directions, valid = normalize_directions(directions)
+    result = _intersect(origins, directions, valid, times, box_min, box_max, speed)
+    result['valid'] = valid
+    result['direction'] = directions
+    return result
+
 
 class Detector:
     def __init__(self, position, size):
@@ -9,77 +88,46 @@ class Detector:
         self.size = size
         self.detections = []
 
-    def calculate_intersection(self, particle, speed, timestamp):
+    @property
+    def box_min(self):
+        return self.position - self.size / 2
+
+    @property
+    def box_max(self):
+        return self.position + self.size / 2
+
+    def calculate_intersection(self, particle, speed, diagnostics=None):
         try:
-            ray_origin = np.array(particle.position)
             ray_direction = np.array(particle.direction)
-            norm = np.linalg.norm(ray_direction)
-            if norm < 1e-8:
-                print(f"Недопустимое направление частицы {particle.type}: {ray_direction}")
-                return None
-            ray_direction = ray_direction / norm
-
-            box_min = self.position - self.size / 2
-            box_max = self.position + self.size / 2
-
-            t_min = np.full(3, -np.inf)
-            t_max = np.full(3, np.inf)
-            for i in range(3):
-                if abs(ray_direction[i]) < 1e-8:
-                    if ray_origin[i] < box_min[i] or ray_origin[i] > box_max[i]:
-                        return None
-                    continue
-                t1 = (box_min[i] - ray_origin[i]) / ray_direction[i]
-                t2 = (box_max[i] - ray_origin[i]) / ray_direction[i]
-                t_min[i] = min(t1, t2)
-                t_max[i] = max(t1, t2)
-            
-            t_near = np.max(t_min)
-            t_far = np.min(t_max)
-
-            if t_near > t_far or t_near < 0:
+            if np.linalg.norm(ray_direction) < 1e-8:
+                events.event('invalid_direction', logging.WARNING, "Недопустимое направление частицы %s: %s", particle.type, ray_direction)
                 return None
 
-            intersection_point = ray_origin + ray_direction * t_near
-            exit_point = ray_origin + ray_direction * t_far
-            track_length = np.linalg.norm(exit_point - intersection_point)
-
-            detection_time = particle.time + t_near / speed
-            if detection_time < 0:
-                print(f"Некорректное время детекции {detection_time} для частицы {particle.type}")
+            result = calculate_intersections(
+                np.array(particle.position)[None, :], ray_direction[None, :], np.array([particle.time]),
+                self.box_min[None, :], self.box_max[None, :], speed
+            )
+            if not result['hit'][0, 0]:
+                if result['crossed'][0, 0]:
+                    events.event('invalid_time', logging.WARNING, "Некорректное время детекции %s для частицы %s", result['time'][0, 0], particle.type)
                 return None
 
+            ray_direction = result['direction'][0]
+            track_length = result['track_length'][0, 0]
             detection = {
-                'time': detection_time,
+                'time': result['time'][0, 0],
                 'track_length': track_length,
                 'particle_type': particle.type,
                 'direction': ray_direction,
                 'is_short_track': track_length < MIN_TRACK_LENGTH
             }
-            
-            history_path = os.path.join('history', timestamp)
-            os.makedirs(history_path, exist_ok=True)
-            diag_file = os.path.join(history_path, f'intersection_log_{timestamp}.csv')
-            with open(diag_file, 'a', newline='', encoding='utf-8') as f:
-                writer = csv.writer(f, delimiter=';')
-                if os.path.getsize(diag_file) == 0:
-                    writer.writerow(['Particle_Type', 'Detector_X', 'Detector_Y', 'Detector_Z', 'Dir_X', 'Dir_Y', 'Dir_Z', 'Track_Length', 'Time'])
-                writer.writerow([
-                    detection['particle_type'],
-                    f"{self.position[0]:.6f}",
-                    f"{self.position[1]:.6f}",
-                    f"{self.position[2]:.6f}",
-                    f"{ray_direction[0]:.6f}",
-                    f"{ray_direction[1]:.6f}",
-                    f"{ray_direction[2]:.6f}",
-                    f"{track_length:.6f}",
-                    f"{detection['time']:.6f}"
-                ])
-            print(f"Пересечение записано в {diag_file}")
-            
+
+            if diagnostics is not None:
+                diagnostics.log_intersections(particle.type, self.position, ray_direction, track_length, detection['time'])
+
             return detection
         except Exception as e:
-            print(f"Ошибка при расчете пересечения для частицы {particle.type} в детекторе {self.position}: {e}")
+            logger.error("Ошибка при расчете пересечения для частицы %s в детекторе %s: %s", particle.type, self.position, e)
             return None
 
     def register_particle(self, detection):
@@ -0,0 +1,236 @@
+import os
+import shutil
+import zipfile
+from utils import np
+from log import get_logger
+from config import DIAGNOSTICS_FORMAT, DIAGNOSTICS_CHUNK_SIZE
+
+logger = get_logger(__name__)
+
+INTERSECTION_COLUMNS = [
+    ('Particle_Type', 'U7', '%s'),
+    ('Detector_X', 'f8', '%.6f'),
+    ('Detector_Y', 'f8', '%.6f'),
+    ('Detector_Z', 'f8', '%.6f'),
+    ('Dir_X', 'f8', '%.6f'),
+    ('Dir_Y', 'f8', '%.6f'),
+    ('Dir_Z', 'f8', '%.6f'),
+    ('Track_Length', 'f8', '%.6f'),
+    ('Time', 'f8', '%.6f'),
+]
+
+DIRECTION_COLUMNS = [
+    ('Theta_deg', 'f8', '%.6f'),
+    ('Phi_deg', 'f8', '%.6f'),
+    ('Dir_X', 'f8', '%.6f'),
+    ('Dir_Y', 'f8', '%.6f'),
+    ('Dir_Z', 'f8', '%.6f'),
+    ('Time', 'f8', '%.6f'),
+]
+
+
+class ColumnBuffer:
+    # npz: каждый столбец дописывается в свой файл в каталоге <path>.columns, а при закрытии
+    # файлы копируются в архив блоками, так что в памяти остается не больше одного буфера.
+    def __init__(self, path, columns, fmt='csv', chunk_size=65536, header=None, encoding='utf-8'):
+        if fmt not in ('csv', 'npz'):
+            raise ValueError(f"Неподдерживаемый формат диагностики: {fmt}")
+        if chunk_size <= 0:
+            raise ValueError("Размер буфера диагностики должен быть положительным")
+        self.path = path
+        self.fmt = fmt
+        self.names = [name for name, _, _ in columns]
+        self.header = self.names if header is None else header
+        self.encoding = encoding
+        self.line_format = ';'.join(f for _, _, f in columns) + '\n'
+        self.chunk_size = chunk_size
+        self.columns = {name: np.empty(chunk_size, dtype=dtype) for name, dtype, _ in columns}
+        self.spool_dir = path + '.columns'
+        self.size = 0
+        self.rows_written = 0
+        self.truncate_to = None
+
+    def spool_path(self, name):
+        return os.path.join(self.spool_dir, f'{name}.bin')
+
+    def truncate(self):
+        # Строки, записанные после восстановленной контрольной точки, отбрасываются.
+        if self.fmt == 'npz':
+            for name in self.names:
+                with open(self.spool_path(name), 'r+b') as f:
+                    f.truncate(self.truncate_to * self.columns[name].itemsize)
+        else:
+            with open(self.path, 'r+b') as f:
+                f.truncate(self.truncate_to)
+        self.truncate_to = None
+
+    def append(self, **values):
+        arrays = [np.atleast_1d(values[name]) for name in self.names]
+        count = len(arrays[0])
+        start = 0
+        while start < count:
+            n = min(count - start, self.chunk_size - self.size)
+            for name, array in zip(self.names, arrays):
+                self.columns[name][self.size:self.size + n] = array[start:start + n]
+            self.size += n
+            start += n
+            if self.size == self.chunk_size:
+                self.flush()
+
+    def flush(self):
+        if self.truncate_to is not None:
+            self.truncate()
+        if self.size == 0:
+            return
+        filled = [self.columns[name][:self.size] for name in self.names]
+        if self.fmt == 'npz':
+            os.makedirs(self.spool_dir, exist_ok=True)
+            mode = 'ab' if self.rows_written else 'wb'
+            for name, column in zip(self.names, filled):
+                with open(self.spool_path(name), mode) as f:
+                    column.tofile(f)
+        else:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            mode = 'a' if self.rows_written else 'w'
+            with open(self.path, mode, newline='', encoding=self.encoding) as f:
+                if not self.rows_written:
+                    f.write(';'.join(self.header) + '\n')
+                f.writelines(self.line_format % row for row in zip(*(column.tolist() for column in filled)))
+        self.rows_written += self.size
+        self.size = 0
+
+    def checkpoint(self):
+        # Строки сбрасываются на диск, сохраняется только позиция в файле (csv)
+        # или число строк в файлах столбцов (npz).
+        self.flush()
+        state = {'rows': np.int64(self.rows_written)}
+        if self.fmt == 'csv':
+            state['offset'] = np.int64(os.path.getsize(self.path) if self.rows_written else 0)
+        return state
+
+    def restore(self, state):
+        self.rows_written = int(state['rows'])
+        position = self.rows_written if self.fmt == 'npz' else int(state['offset'])
+        self.truncate_to = position if position else None
+
+    def write_npz(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with zipfile.ZipFile(tmp_path, 'w', zipfile.ZIP_STORED, allowZip64=True) as archive:
+            for name in self.names:
+                dtype = self.columns[name].dtype
+                header = {'descr': np.lib.format.dtype_to_descr(dtype), 'fortran_order': False, 'shape': (self.rows_written,)}
+                with archive.open(f'{name}.npy', 'w', force_zip64=True) as out, open(self.spool_path(name), 'rb') as src:
+                    np.lib.format.write_array_header_2_0(out, header)
+                    shutil.copyfileobj(src, out, self.chunk_size * dtype.itemsize)
+        os.replace(tmp_path, self.path)
+        shutil.rmtree(self.spool_dir)
+
+    def close(self):
+        self.flush()
+        if self.fmt == 'npz' and self.rows_written:
+            self.write_npz()
+        return self.path if self.rows_written else None
+
+
+def merge_files(paths, path):
+    # Объединяет файлы частей параллельного прогона в один файл в порядке частей:
+    # csv - построчно без повторных заголовков, npz - копированием данных столбцов без загрузки в память.
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + '.tmp'
+    if path.endswith('.npz'):
+        archives = [zipfile.ZipFile(part) for part in paths]
+        try:
+            with zipfile.ZipFile(tmp_path, 'w', zipfile.ZIP_STORED, allowZip64=True) as out_archive:
+                for member in archives[0].namelist():
+                    sources, rows = [], 0
+                    for archive in archives:
+                        src = archive.open(member)
+                        if np.lib.format.read_magic(src) == (1, 0):
+                            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(src)
+                        else:
+                            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(src)
+                        sources.append(src)
+                        rows += shape[0]
+                    header = {'descr': np.lib.format.dtype_to_descr(dtype), 'fortran_order': fortran_order, 'shape': (rows,)}
+                    with out_archive.open(member, 'w', force_zip64=True) as out:
+                        np.lib.format.write_array_header_2_0(out, header)
+                        for src in sources:
+                            shutil.copyfileobj(src, out)
+                            src.close()
+        finally:
+            for archive in archives:
+                archive.close()
+    else:
+        with open(tmp_path, 'wb') as out:
+            for index, part in enumerate(paths):
+                with open(part, 'rb') as src:
+                    if index:
+                        src.readline()
+                    shutil.copyfileobj(src, out)
+    os.replace(tmp_path, path)
+    for part in paths:
+        os.remove(part)
+    return path
+
+
+class Diagnostics:
+    def __init__(self, timestamp, fmt=DIAGNOSTICS_FORMAT, chunk_size=DIAGNOSTICS_CHUNK_SIZE, part=None):
+        history_path = os.path.join('history', timestamp)
+        suffix = timestamp if part is None else f'{timestamp}_part{part}'
+        self.intersections = ColumnBuffer(
+            os.path.join(history_path, f'intersection_log_{suffix}.{fmt}'), INTERSECTION_COLUMNS, fmt, chunk_size
+        )
+        self.directions = ColumnBuffer(
+            os.path.join(history_path, f'generated_directions_{suffix}.{fmt}'), DIRECTION_COLUMNS, fmt, chunk_size
+        )
+
+    def log_intersections(self, particle_types, detector_positions, directions, track_lengths, times):
+        detector_positions = np.atleast_2d(detector_positions)
+        directions = np.atleast_2d(directions)
+        self.intersections.append(
+            Particle_Type=particle_types,
+            Detector_X=detector_positions[:, 0],
+            Detector_Y=detector_positions[:, 1],
+            Detector_Z=detector_positions[:, 2],
+            Dir_X=directions[:, 0],
+            Dir_Y=directions[:, 1],
+            Dir_Z=directions[:, 2],
+            Track_Length=track_lengths,
+            Time=times,
+        )
+
+    def log_directions(self, theta_deg, phi_deg, directions, times):
+        directions = np.atleast_2d(directions)
+        self.directions.append(
+            Theta_deg=theta_deg,
+            Phi_deg=phi_deg,
+            Dir_X=directions[:, 0],
+            Dir_Y=directions[:, 1],
+            Dir_Z=directions[:, 2],
+            Time=times,
+        )
+
+    def checkpoint(self):
+        return {'intersections': self.intersections.checkpoint(), 'directions': self.directions.checkpoint()}
+
+    def restore(self, state):
+        self.intersections.restore(state['intersections'])
+        self.directions.restore(state['directions'])
+
+    def flush(self):
+        self.intersections.flush()
+        self.directions.flush()
+
+    def close(self):
+        saved = []
+        for buffer in (self.intersections, self.directions):
+            try:
+                path = buffer.close()
+                if path:
+                    saved.append(path)
+            except PermissionError as e:
+                logger.error("Ошибка записи файла %s: Отказано в доступе (%s). Диагностика не сохранена.", buffer.path, e)
+        for path in saved:
+            logger.info("Диагностика сохранена в %s", path)
+        return saved
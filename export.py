@@ -0,0 +1,160 @@
+import os
+import glob
+import json
+from utils import np
+from results import ChunkedResultsWriter
+
+# Колонки результатов: detector (K,), detector_pos (K, 3), time (K,), particle_type (K,) - имена типов,
+# track_length (K,), particle_direction (K, 3), weight (K,).
+BINARY_FORMATS = ('.npy', '.npz', '.parquet', '.arrow')
+VECTOR_COLUMNS = ('detector_pos', 'particle_direction')
+
+
+def group_by_detector(columns):
+    # Порядок "сшивки": детекторы в порядке первого появления, внутри - хронология прогона.
+    # Возвращает перестановку строк, координаты детекторов и номер группы каждой переставленной строки.
+    positions = columns['detector_pos']
+    if not len(positions):
+        return np.empty(0, dtype=np.int64), np.empty((0, 3)), np.empty(0, dtype=np.int64)
+    unique, first, inverse = np.unique(positions, axis=0, return_index=True, return_inverse=True)
+    rank = np.empty(len(first), dtype=np.int64)
+    rank[np.argsort(first)] = np.arange(len(first))
+    group = rank[inverse.reshape(-1)]
+    order = np.argsort(group, kind='stable')
+    return order, unique[np.argsort(first)], group[order]
+
+
+def export_csv(columns, filepath):
+    order, _, _ = group_by_detector(columns)
+    writer = ChunkedResultsWriter(filepath, 'csv', max(len(order), 1))
+    writer.consume({name: columns[name][order] for name in ('detector_pos', 'time', 'particle_type', 'track_length', 'particle_direction')})
+    if writer.close() is None:
+        with open(filepath, 'w', newline='', encoding='utf-8-sig') as f:
+            f.write(';'.join(writer.buffer.header) + '\n')
+
+
+def export_json(columns, filepath):
+    order, positions, group = group_by_detector(columns)
+    keys = [f"{x:.6f};{y:.6f};{z:.6f}" for x, y, z in positions.tolist()]
+    stitched = {key: [] for key in keys}
+    for index, time, particle_type, track_length, direction, weight in zip(
+        group.tolist(), columns['time'][order].tolist(), columns['particle_type'][order].tolist(),
+        columns['track_length'][order].tolist(), columns['particle_direction'][order].tolist(),
+        columns['weight'][order].tolist()
+    ):
+        stitched[keys[index]].append({
+            'time': time,
+            'particle_type': particle_type,
+            'track_length': track_length,
+            'particle_direction': direction,
+            'weight': weight
+        })
+    with open(filepath, 'w', encoding='utf-8') as f:
+        json.dump(stitched, f)
+
+
+def flat_columns(columns):
+    flat = {}
+    for name, values in columns.items():
+        if name in VECTOR_COLUMNS:
+            for axis, suffix in enumerate('xyz'):
+                flat[f'{name}_{suffix}'] = values[:, axis]
+        else:
+            flat[name] = values
+    return flat
+
+
+def output_path(filepath):
+    # Формат .npy записывается каталогом с отдельным .npy на колонку, который читается через np.load(mmap_mode='r').
+    return filepath[:-len('.npy')] if filepath.endswith('.npy') else filepath
+
+
+def export_binary(columns, filepath):
+    if filepath.endswith('.npz'):
+        np.savez(filepath, **columns)
+    elif filepath.endswith('.npy'):
+        directory = output_path(filepath)
+        os.makedirs(directory, exist_ok=True)
+        for name, values in columns.items():
+            np.save(os.path.join(directory, f'{name}.npy'), np.ascontiguousarray(values))
+    else:
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            import pyarrow.feather as feather
+        except ImportError:
+            raise ValueError("Для форматов .parquet и .arrow требуется пакет pyarrow")
+        table = pa.table(flat_columns(columns))
+        if filepath.endswith('.parquet'):
+            pq.write_table(table, filepath)
+        else:
+            feather.write_feather(table, filepath)
+
+
+def export_columns(columns, filepath):
+    if filepath.endswith('.json'):
+        export_json(columns, filepath)
+    elif filepath.endswith('.csv'):
+        export_csv(columns, filepath)
+    elif filepath.endswith(BINARY_FORMATS):
+        export_binary(columns, filepath)
+    else:
+        raise ValueError("Неподдерживаемый формат файла. Используйте .json, .csv, .npz, .npy, .parquet или .arrow")
+
+
+def group_columns(flat):
+    # Обратное преобразование к flat_columns: колонки <имя>_x, _y, _z собираются в (K, 3).
+    columns = {}
+    for name, values in flat.items():
+        base, _, axis = name.rpartition('_')
+        if base in VECTOR_COLUMNS and axis in ('x', 'y', 'z'):
+            columns.setdefault(base, [None] * 3)['xyz'.index(axis)] = values
+        else:
+            columns[name] = values
+    for name in VECTOR_COLUMNS:
+        if isinstance(columns.get(name), list):
+            columns[name] = np.stack(columns[name], axis=1)
+    return columns
+
+
+def load_columns(path, mmap=True):
+    if os.path.isdir(path) or path.endswith('.npy'):
+        directory = path[:-len('.npy')] if path.endswith('.npy') else path
+        return group_columns({
+            os.path.splitext(os.path.basename(name))[0]: np.load(name, mmap_mode='r' if mmap else None)
+            for name in sorted(glob.glob(os.path.join(directory, '*.npy')))
+        })
+    if path.endswith('.npz'):
+        with np.load(path) as data:
+            return group_columns({name: data[name] for name in data.files})
+    if path.endswith(('.parquet', '.arrow')):
+        try:
+            import pyarrow.parquet as pq
+            import pyarrow.feather as feather
+        except ImportError:
+            raise ValueError("Для форматов .parquet и .arrow требуется пакет pyarrow")
+        table = pq.read_table(path) if path.endswith('.parquet') else feather.read_table(path, memory_map=mmap)
+        columns = group_columns({name: table.column(name).to_numpy() for name in table.column_names})
+        if 'particle_type' in columns and columns['particle_type'].dtype.kind == 'O':
+            # Строки pyarrow возвращаются массивом объектов.
+            columns['particle_type'] = columns['particle_type'].astype('U7')
+        return columns
+    raise ValueError(f"Неподдерживаемый формат файла {path}")
+
+
+def load_run(timestamp, name=None):
+    # Находит бинарные результаты прогона в history/<timestamp>/ и открывает их без разбора текста.
+    history_path = os.path.join('history', timestamp)
+    candidates = [name] if name else [
+        f'results_{timestamp}', f'results_{timestamp}.npz', f'results_{timestamp}.parquet', f'results_{timestamp}.arrow'
+    ]
+    for candidate in candidates:
+        path = os.path.join(history_path, candidate)
+        if not os.path.exists(path):
+            continue
+        if not os.path.isdir(path) and not path.endswith(BINARY_FORMATS):
+            raise ValueError(f"{path}: нужны бинарные результаты ({', '.join(BINARY_FORMATS)}), текстовые форматы не читаются")
+        return load_columns(path)
+    raise FileNotFoundError(
+        f"В {history_path} не найдено бинарных результатов: выполните run --export npz или export с форматом npz"
+    )
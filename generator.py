@@ -1,67 +1,76 @@
-import os
-import csv
+import logging
 from utils import np
-from particle import Particle
-from config import GENERATOR_PULSE_DISTRIBUTION, GENERATOR_PULSE_MEAN, GENERATOR_PULSE_STD, GENERATOR_PULSE_UNIFORM_MIN, GENERATOR_PULSE_UNIFORM_MAX
+from particle import Particle, ParticleBatch, PARTICLE_CODES
+from log import events
+from config import NUM_NEUTRONS, NUM_ALPHAS, GENERATOR_PULSE_DISTRIBUTION, GENERATOR_PULSE_MEAN, GENERATOR_PULSE_STD, GENERATOR_PULSE_UNIFORM_MIN, GENERATOR_PULSE_UNIFORM_MAX
 
 class Generator:
-    def __init__(self, position=(0.0, 0.0, 0.0)):
+    def __init__(self, position=(0.0, 0.0, 0.0), seed=None):
         self.position = np.array(position)
+        self.rng = np.random.default_rng(seed)
 
-    def emit_particles(self, current_time, timestamp, num_neutrons=10, num_alphas=5):
-        particles = []
-        directions_log = []
-        
-        def generate_direction():
-            u = np.random.uniform(0, 1)
-            v = np.random.uniform(0, 1)
+    def pulse_offsets(self, count, rng=None):
+        rng = self.rng if rng is None else rng
+        if GENERATOR_PULSE_DISTRIBUTION == 'gaussian':
+            return rng.normal(GENERATOR_PULSE_MEAN, GENERATOR_PULSE_STD, count)
+        if GENERATOR_PULSE_DISTRIBUTION == 'uniform':
+            return rng.uniform(GENERATOR_PULSE_UNIFORM_MIN, GENERATOR_PULSE_UNIFORM_MAX, count)
+        return np.zeros(count)
+
+    def emit_batch(self, current_time, num_neutrons=NUM_NEUTRONS, num_alphas=NUM_ALPHAS, diagnostics=None, rng=None, acceptance=None):
+        # Альфа-частицы испускаются под углом 180° к первым num_alphas нейтронам
+        # и наследуют их время испускания и вес, поэтому случайные числа для них не тянутся.
+        # С таблицей аксептанса направления нейтронов разыгрываются только в сторону детекторов.
+        if num_alphas > num_neutrons:
+            raise ValueError("Число альфа-частиц не может превышать число нейтронов")
+        rng = self.rng if rng is None else rng
+
+        if acceptance is None:
+            u, v = rng.random((2, num_neutrons))
             theta = 2 * np.pi * u
             phi = np.arccos(1 - 2 * v)
-            direction = np.array([np.sin(phi) * np.cos(theta), np.sin(phi) * np.sin(theta), np.cos(phi)])
-            norm = np.linalg.norm(direction)
-            if norm < 1e-8:
-                return generate_direction()
-            return direction / norm, theta, phi
+            weights = None
+        else:
+            theta, phi, weights = acceptance.sample_angles(rng, num_neutrons, paired=num_alphas > 0)
+        sin_phi = np.sin(phi)
+        emit_times = np.maximum(current_time, current_time + self.pulse_offsets(num_neutrons, rng))
 
-        for _ in range(num_neutrons):
-            direction, theta, phi = generate_direction()
-            if GENERATOR_PULSE_DISTRIBUTION == 'gaussian':
-                time_offset = np.random.normal(GENERATOR_PULSE_MEAN, GENERATOR_PULSE_STD)
-            elif GENERATOR_PULSE_DISTRIBUTION == 'uniform':
-                time_offset = np.random.uniform(GENERATOR_PULSE_UNIFORM_MIN, GENERATOR_PULSE_UNIFORM_MAX)
-            else:
-                time_offset = 0
-            emit_time = max(current_time, current_time + time_offset)
-            neutron = Particle('neutron', self.position, direction, emit_time)
-            particles.append(neutron)
-            directions_log.append([np.rad2deg(theta), np.rad2deg(phi), direction[0], direction[1], direction[2]])
-            print(f"Сгенерирован нейтрон с направлением {direction} в {emit_time}")
+        particles = ParticleBatch.empty(num_neutrons + num_alphas)
+        particles.positions[:] = self.position
+        particles.types[:num_neutrons] = PARTICLE_CODES['neutron']
+        particles.types[num_neutrons:] = PARTICLE_CODES['alpha']
+        directions = particles.directions
+        directions[:num_neutrons, 0] = sin_phi * np.cos(theta)
+        directions[:num_neutrons, 1] = sin_phi * np.sin(theta)
+        directions[:num_neutrons, 2] = np.cos(phi)
+        np.negative(directions[:num_alphas], out=directions[num_neutrons:])
+        particles.times[:num_neutrons] = emit_times
+        particles.times[num_neutrons:] = emit_times[:num_alphas]
+        if weights is not None:
+            particles.weights[:num_neutrons] = weights
+            particles.weights[num_neutrons:] = weights[:num_alphas]
 
-        for _ in range(num_alphas):
-            direction, theta, phi = generate_direction()
-            if GENERATOR_PULSE_DISTRIBUTION == 'gaussian':
-                time_offset = np.random.normal(GENERATOR_PULSE_MEAN, GENERATOR_PULSE_STD)
-            elif GENERATOR_PULSE_DISTRIBUTION == 'uniform':
-                time_offset = np.random.uniform(GENERATOR_PULSE_UNIFORM_MIN, GENERATOR_PULSE_UNIFORM_MAX)
-            else:
-                time_offset = 0
-            emit_time = max(current_time, current_time + time_offset)
-            alpha = Particle('alpha', self.position, direction, emit_time)
-            particles.append(alpha)
-            directions_log.append([np.rad2deg(theta), np.rad2deg(phi), direction[0], direction[1], direction[2]])
-            print(f"Сгенерирована альфа-частица с направлением {direction} в {emit_time}")
-        
-        history_path = os.path.join('history', timestamp)
-        os.makedirs(history_path, exist_ok=True)
-        diag_file = os.path.join(history_path, f'generated_directions_{timestamp}.csv')
-        try:
-            with open(diag_file, 'w', newline='', encoding='utf-8') as f:
-                writer = csv.writer(f, delimiter=';')
-                writer.writerow(['Theta_deg', 'Phi_deg', 'Dir_X', 'Dir_Y', 'Dir_Z'])
-                for row in directions_log:
-                    writer.writerow([f"{x:.6f}" for x in row])
-            print(f"Диагностика направлений сохранена в {diag_file}")
-        except PermissionError as e:
-            print(f"Ошибка записи файла {diag_file}: Отказано в доступе ({e}). Диагностика направлений не сохранена.")
-        
+        if diagnostics is not None and len(particles):
+            theta_deg = np.rad2deg(theta)
+            phi_deg = np.rad2deg(phi)
+            diagnostics.log_directions(
+                np.concatenate([theta_deg, np.mod(theta_deg[:num_alphas] + 180, 360)]),
+                np.concatenate([phi_deg, 180 - phi_deg[:num_alphas]]),
+                particles.directions,
+                particles.times
+            )
+
+        events.count('generated', len(particles))
+        if events.debug:
+            for k in range(len(particles)):
+                if k < num_neutrons:
+                    events.sample('generated', logging.DEBUG, "Сгенерирован нейтрон с направлением %s в %s", directions[k], particles.times[k])
+                else:
+                    events.sample('generated', logging.DEBUG, "Сгенерирована альфа-частица с направлением %s в %s", directions[k], particles.times[k])
         return particles
+
+    def emit_particles(self, current_time, diagnostics=None, num_neutrons=NUM_NEUTRONS, num_alphas=NUM_ALPHAS):
+        return [
+            Particle(view.type, view.position, view.direction, view.time)
+            for view in self.emit_batch(current_time, num_neutrons, num_alphas, diagnostics)
+        ]
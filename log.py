@@ -0,0 +1,86 @@
+import sys
+import logging
+from collections import Counter
+from config import LOG_LEVEL, LOG_FORMAT, LOG_FILE, LOG_EVENT_LIMIT, LOG_EVENT_SAMPLE
+
+ROOT_LOGGER = 'simulator'
+
+
+def configure(level=LOG_LEVEL, filename=LOG_FILE, fmt=LOG_FORMAT):
+    # По умолчанию сообщения уровня INFO выводятся в stdout в прежнем виде.
+    root = logging.getLogger(ROOT_LOGGER)
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+        handler.close()
+    handler = logging.FileHandler(filename, encoding='utf-8') if filename else logging.StreamHandler(sys.stdout)
+    handler.setFormatter(logging.Formatter(fmt))
+    root.addHandler(handler)
+    root.setLevel(level)
+    root.propagate = False
+    events.refresh()
+    return root
+
+
+def get_level():
+    return logging.getLogger(ROOT_LOGGER).level
+
+
+def set_level(level):
+    logging.getLogger(ROOT_LOGGER).setLevel(level)
+    events.refresh()
+
+
+def get_logger(name):
+    return logging.getLogger(f'{ROOT_LOGGER}.{name}')
+
+
+class EventLog:
+    # Счетчики событий прогона и прореженный вывод сообщений о единичных событиях:
+    # по каждому ключу выводятся первые limit сообщений, затем каждое sample-е.
+    # Во внутренних циклах сообщения формируются только при self.debug, чтобы в
+    # рабочем режиме не было ни одного вызова форматирования.
+    def __init__(self, logger, limit=LOG_EVENT_LIMIT, sample=LOG_EVENT_SAMPLE):
+        if limit < 0 or sample <= 0:
+            raise ValueError("Параметры прореживания журнала должны быть положительными")
+        self.logger = logger
+        self.limit = limit
+        self.sample_every = sample
+        self.counts = Counter()
+        self.emitted = Counter()
+        self.debug = False
+        self.refresh()
+
+    def refresh(self):
+        self.debug = self.logger.isEnabledFor(logging.DEBUG)
+
+    def reset(self):
+        self.counts.clear()
+        self.emitted.clear()
+        self.refresh()
+
+    def count(self, key, n=1):
+        self.counts[key] += n
+
+    def sample(self, key, level, message, *args):
+        if not self.logger.isEnabledFor(level):
+            return
+        emitted = self.emitted[key] = self.emitted[key] + 1
+        if emitted <= self.limit or emitted % self.sample_every == 0:
+            self.logger.log(level, message, *args)
+
+    def event(self, key, level, message, *args):
+        self.count(key)
+        self.sample(key, level, message, *args)
+
+    def merge(self, counts):
+        self.counts.update(counts)
+
+    def summary(self, level=logging.INFO):
+        if self.counts and self.logger.isEnabledFor(level):
+            self.logger.log(level, "Счетчики событий прогона: %s", ', '.join(f'{key}={value}' for key, value in sorted(self.counts.items())))
+
+
+events = EventLog(get_logger('events'))
+
+if not logging.getLogger(ROOT_LOGGER).handlers:
+    configure()
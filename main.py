@@ -1,17 +1,246 @@
-from simulation import Simulation
-from visualization import visualize_3d, visualize_angular_distribution
+import os
+import ast
+import sys
+import json
+import argparse
+from datetime import datetime
 import config
+from particle import PARTICLE_TYPES
 
-sim = Simulation()
-timestamp = sim.run()
-sim.export_results(f'results_{timestamp}.csv', timestamp)
+# Модули симуляции и визуализации импортируются внутри команд: переопределения config.py
+# должны быть применены до их импорта, а команды run и export не загружают matplotlib.
 
-DISTANCES = config.DISTANCES[:-1]
-ANGLES = config.ANGLES[:-1]
+EXPORT_FORMATS = ('csv', 'json', 'npz', 'npy', 'parquet', 'arrow')
 
-for distance in DISTANCES:
-    for angle in ANGLES:
-        visualize_3d(sim.detectors, sim.generator.position, sim.generator.emit_particles(sim.time, timestamp), timestamp, distance, angle)
 
-results = [r for r in sim.results]
-visualize_angular_distribution(results, timestamp)
+def parse_value(text):
+    try:
+        return ast.literal_eval(text)
+    except (ValueError, SyntaxError):
+        return text
+
+
+def collect_overrides(files, pairs):
+    overrides = {}
+    for path in files or []:
+        with open(path, encoding='utf-8') as f:
+            overrides.update(json.load(f))
+    for pair in pairs or []:
+        key, sep, value = pair.partition('=')
+        if not sep:
+            raise ValueError(f"Ожидается параметр в виде КЛЮЧ=ЗНАЧЕНИЕ: {pair}")
+        overrides[key.strip()] = parse_value(value.strip())
+    for key, value in overrides.items():
+        if not key.isupper() or key == 'CONFIG_OVERRIDES_ENV' or not hasattr(config, key) or callable(getattr(config, key)):
+            raise ValueError(f"Неизвестный параметр config.py: {key}")
+    return overrides
+
+
+def apply_overrides(overrides):
+    if not overrides:
+        return
+    inherited = json.loads(os.environ.get(config.CONFIG_OVERRIDES_ENV, '{}'))
+    try:
+        os.environ[config.CONFIG_OVERRIDES_ENV] = json.dumps({**inherited, **overrides})
+    except TypeError as e:
+        raise ValueError(f"Значение параметра не сериализуется в JSON: {e}")
+    for key, value in overrides.items():
+        setattr(config, key, value)
+
+
+def export_path(timestamp, fmt):
+    return os.path.join('history', timestamp, f'results_{timestamp}.{fmt}')
+
+
+def run_columns(sim, timestamp):
+    # В потоковом режиме результаты не хранятся в памяти и читаются из записанного файла.
+    if not sim.streaming:
+        return sim.result_columns()
+    from export import load_run
+    try:
+        return load_run(timestamp)
+    except FileNotFoundError:
+        raise ValueError("Для поиска совпадений в потоковом режиме нужны бинарные результаты: задайте STREAMING_FORMAT='npz'")
+
+
+def save_coincidences(columns, num_detectors, timestamp, pair_types=None):
+    from coincidence import find_coincidences
+    if not len(columns['time']):
+        raise ValueError(f"В прогоне {timestamp} нет детекций, совпадения не сохранены")
+    pair_types = config.COINCIDENCE_PAIR_TYPES if pair_types is None else pair_types
+    coincidences = find_coincidences(columns, num_detectors, pair_types=pair_types)
+    return coincidences.save(os.path.join('history', timestamp, f'coincidences_{timestamp}.npz'))
+
+
+def sweep_jobs(distances, angles, timestamp):
+    from sweep import point_simulation
+    from visualization import visualize_3d
+    jobs = []
+    for distance in distances:
+        for angle in angles:
+            point = point_simulation(distance, angle)
+            jobs.append((visualize_3d, (point.matrix, point.generator.position, point.generator.emit_batch(0.0), timestamp, distance, angle)))
+    return jobs
+
+
+def command_run(args):
+    from simulation import Simulation
+    if args.resume:
+        timestamp = args.resume
+        sim = Simulation.resume(timestamp)
+    else:
+        sim = Simulation(seed=args.seed)
+        timestamp = sim.run(workers=args.workers, timestamp=args.timestamp)
+    for fmt in args.export:
+        sim.export_results(f'results_{timestamp}.{fmt}', timestamp)
+    if args.coincidences:
+        save_coincidences(run_columns(sim, timestamp), len(sim.detectors), timestamp, args.pair_types)
+
+
+def command_export(args):
+    from export import load_run, export_columns, output_path
+    from log import get_logger
+    logger = get_logger('main')
+    columns = load_run(args.timestamp, args.source)
+    for fmt in args.formats:
+        path = export_path(args.timestamp, fmt)
+        export_columns(columns, path)
+        logger.info("Результаты экспортированы в %s в формате %s", output_path(path), fmt.upper())
+    if args.coincidences:
+        save_coincidences(columns, len(config.DETECTOR_POSITIONS), args.timestamp, args.pair_types)
+
+
+def command_plot(args):
+    from export import load_run
+    from results import AngularHistogram
+    from visualization import visualize_angular_distribution, render_figures
+    histogram = AngularHistogram(config.ANGULAR_HISTOGRAM_BINS)
+    histogram.consume(load_run(args.timestamp, args.source))
+    jobs = sweep_jobs(args.distances, args.angles, args.timestamp)
+    jobs.append((visualize_angular_distribution, (histogram, args.timestamp)))
+    render_figures(jobs, config.PLOT_WORKERS)
+
+
+def command_sweep(args):
+    from sweep import run_sweep
+    distances = config.DISTANCES if args.distances is None else args.distances
+    angles = config.ANGLES if args.angles is None else args.angles
+    run_sweep(distances, angles, args.seed, args.workers)
+    if args.plot:
+        from visualization import render_figures
+        render_figures(sweep_jobs(distances, angles, datetime.now().strftime("%Y-%m-%d_%H-%M-%S")), config.PLOT_WORKERS)
+
+
+def command_bench(args):
+    import bench
+    cases = bench.bench_cases(
+        args.particles or bench.BENCH_PARTICLES, args.grids or bench.BENCH_GRIDS, args.durations or bench.BENCH_DURATIONS
+    )
+    bench.run_benchmark(cases, bench.BENCH_SEED if args.seed is None else args.seed, args.plots)
+
+
+def command_all(args):
+    # Полный конвейер без подкоманды: прогон, экспорт, совпадения и графики.
+    # Сканирование с сохранением точек выполняется отдельной командой sweep.
+    from simulation import Simulation
+    from visualization import visualize_angular_distribution, render_figures
+    sim = Simulation()
+    timestamp = sim.run()
+    sim.export_results(f'results_{timestamp}.csv', timestamp)
+    sim.export_results(f'results_{timestamp}.npz', timestamp)
+    save_coincidences(run_columns(sim, timestamp), len(sim.detectors), timestamp)
+
+    jobs = sweep_jobs(config.DISTANCES[:-1], config.ANGLES[:-1], timestamp)
+    jobs.append((visualize_angular_distribution, (sim.histogram, timestamp)))
+    render_figures(jobs, config.PLOT_WORKERS)
+
+
+def add_common(parser, suppress=False):
+    default = argparse.SUPPRESS if suppress else None
+    parser.add_argument('--set', dest='overrides', action='append', metavar='КЛЮЧ=ЗНАЧЕНИЕ', default=default,
+                        help='переопределить параметр config.py (значение - литерал Python)')
+    parser.add_argument('--config', dest='config_files', action='append', metavar='ФАЙЛ', default=default,
+                        help='JSON-файл с переопределениями параметров config.py')
+    parser.add_argument('-q', '--quiet', action='store_true', default=argparse.SUPPRESS if suppress else False,
+                        help='выводить только предупреждения и ошибки')
+    parser.add_argument('-v', '--verbose', action='store_true', default=argparse.SUPPRESS if suppress else False,
+                        help='выводить отладочные сообщения')
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description='Моделирование генератора частиц и детекторной матрицы')
+    add_common(parser)
+    commands = parser.add_subparsers(dest='command')
+
+    run = commands.add_parser('run', help='прогон симуляции')
+    add_common(run, suppress=True)
+    run.add_argument('--seed', type=int, help='зерно генератора случайных чисел')
+    run.add_argument('--workers', type=int, help='число процессов')
+    run.add_argument('--timestamp', help='имя каталога прогона в history/')
+    run.add_argument('--resume', metavar='TIMESTAMP', help='продолжить прогон с последней контрольной точки')
+    run.add_argument('--export', nargs='*', choices=EXPORT_FORMATS, default=['csv'], help='форматы экспорта результатов')
+    run.add_argument('--coincidences', action='store_true', help='найти совпадения между детекторами')
+    run.add_argument('--pair-types', nargs=2, choices=PARTICLE_TYPES, metavar='ТИП',
+                     help='учитывать только совпадения пары типов частиц, например neutron alpha')
+    run.set_defaults(handler=command_run)
+
+    export = commands.add_parser('export', help='экспорт сохраненных бинарных результатов прогона')
+    add_common(export, suppress=True)
+    export.add_argument('timestamp', help='каталог прогона в history/')
+    export.add_argument('--source', help='имя файла или каталога с результатами внутри history/<timestamp>/')
+    export.add_argument('--formats', nargs='+', choices=EXPORT_FORMATS, default=['csv'])
+    export.add_argument('--coincidences', action='store_true', help='найти совпадения между детекторами')
+    export.add_argument('--pair-types', nargs=2, choices=PARTICLE_TYPES, metavar='ТИП',
+                        help='учитывать только совпадения пары типов частиц, например neutron alpha')
+    export.set_defaults(handler=command_export)
+
+    plot = commands.add_parser('plot', help='графики по сохраненным результатам прогона')
+    add_common(plot, suppress=True)
+    plot.add_argument('timestamp', help='каталог прогона в history/')
+    plot.add_argument('--source', help='имя файла или каталога с результатами внутри history/<timestamp>/')
+    plot.add_argument('--distances', nargs='*', type=float, default=[], help='расстояния для 3D-визуализации')
+    plot.add_argument('--angles', nargs='*', type=float, default=[], help='углы для 3D-визуализации')
+    plot.set_defaults(handler=command_plot)
+
+    sweep = commands.add_parser('sweep', help='сканирование по расстояниям и углам')
+    add_common(sweep, suppress=True)
+    sweep.add_argument('--distances', nargs='+', type=float)
+    sweep.add_argument('--angles', nargs='+', type=float)
+    sweep.add_argument('--seed', type=int)
+    sweep.add_argument('--workers', type=int)
+    sweep.add_argument('--plot', action='store_true', help='построить 3D-визуализацию для каждой точки')
+    sweep.set_defaults(handler=command_sweep)
+
+    bench = commands.add_parser('bench', help='бенчмарк производительности')
+    add_common(bench, suppress=True)
+    bench.add_argument('--particles', nargs='+', type=int, help='число нейтронов за шаг')
+    bench.add_argument('--grids', nargs='+', type=int, help='размеры матрицы n x n')
+    bench.add_argument('--durations', nargs='+', type=float, help='длительности прогона, с')
+    bench.add_argument('--seed', type=int)
+    bench.add_argument('--plots', action='store_true', help='включить построение графиков в замеры')
+    bench.set_defaults(handler=command_bench)
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    try:
+        overrides = collect_overrides(args.config_files, args.overrides)
+        if args.quiet:
+            overrides['LOG_LEVEL'] = 'WARNING'
+        if args.verbose:
+            overrides['LOG_LEVEL'] = 'DEBUG'
+        apply_overrides(overrides)
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+    handler = getattr(args, 'handler', command_all)
+    try:
+        handler(args)
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,75 @@
+from utils import np
+from config import TRAJECTORY_TILT_AXIS
+
+
+def rotation_matrices(axis, angles_deg):
+    # Формула Родрига для набора углов: (K,) -> (K, 3, 3).
+    axis = np.asarray(axis, dtype=float)
+    axis = axis / np.linalg.norm(axis)
+    angles = np.deg2rad(np.atleast_1d(np.asarray(angles_deg, dtype=float)))
+    k = np.array([
+        [0.0, -axis[2], axis[1]],
+        [axis[2], 0.0, -axis[0]],
+        [-axis[1], axis[0], 0.0],
+    ])
+    sin = np.sin(angles)[:, None, None]
+    cos = np.cos(angles)[:, None, None]
+    return np.eye(3) + sin * k + (1 - cos) * (k @ k)
+
+
+class DetectorMatrix:
+    def __init__(self, positions, size, tilt_axis=TRAJECTORY_TILT_AXIS):
+        self.local_positions = np.array(positions, dtype=float)
+        self.size = size
+        self.box_min = self.local_positions - size / 2
+        self.box_max = self.local_positions + size / 2
+        self.pivot = self.local_positions.mean(axis=0)
+        self.tilt_axis = tilt_axis
+        self.translation = np.zeros(3)
+        self.tilt = 0.0
+        self.rotation = np.eye(3)
+        self.world_positions = self.local_positions.copy()
+        self.version = 0
+        self.rotations = {}
+
+    def precompute(self, trajectory, times):
+        poses = [trajectory(t) for t in times]
+        missing = np.unique([float(tilt) for _, tilt in poses if tilt != 0 and float(tilt) not in self.rotations])
+        if len(missing):
+            self.rotations.update(zip(missing.tolist(), rotation_matrices(self.tilt_axis, missing)))
+        return poses
+
+    def rotation_for(self, tilt):
+        rotation = self.rotations.get(tilt)
+        if rotation is None:
+            rotation = rotation_matrices(self.tilt_axis, tilt)[0]
+            self.rotations[tilt] = rotation
+        return rotation
+
+    def set_pose(self, translation, tilt):
+        translation = np.asarray(translation, dtype=float)
+        tilt = float(tilt)
+        if tilt == self.tilt and np.array_equal(translation, self.translation):
+            return False
+        self.rotation = np.eye(3) if tilt == 0 else self.rotation_for(tilt)
+        self.translation = translation
+        self.tilt = tilt
+        self.world_positions = self.to_world(self.local_positions)
+        self.version += 1
+        return True
+
+    def to_world(self, points):
+        return (points - self.pivot) @ self.rotation.T + self.pivot + self.translation
+
+    def to_local(self, origins, directions):
+        # Лучи переводятся в систему координат матрицы, где детекторы остаются осевыми коробками.
+        if self.tilt == 0:
+            if not np.any(self.translation):
+                return origins, directions
+            return origins - self.translation, directions
+        return (origins - self.pivot - self.translation) @ self.rotation + self.pivot, directions @ self.rotation
+
+    def to_world_directions(self, directions):
+        if self.tilt == 0:
+            return directions
+        return directions @ self.rotation.T
@@ -1,6 +1,11 @@
 from utils import np
 
+PARTICLE_TYPES = ('neutron', 'alpha')
+PARTICLE_CODES = {name: code for code, name in enumerate(PARTICLE_TYPES)}
+
 class Particle:
+    __slots__ = ('type', 'position', 'direction', 'time')
+
     def __init__(self, type, position, direction, time):
         self.type = type
         self.position = np.array(position)
@@ -9,3 +14,95 @@ class Particle:
             raise ValueError("Направление частицы не может быть нулевым")
         self.direction = np.array(direction) / norm
         self.time = time
+
+class ParticleView:
+    __slots__ = ('batch', 'index')
+
+    def __init__(self, batch, index):
+        self.batch = batch
+        self.index = index
+
+    @property
+    def type(self):
+        return PARTICLE_TYPES[self.batch.types[self.index]]
+
+    @property
+    def position(self):
+        return self.batch.positions[self.index]
+
+    @property
+    def direction(self):
+        return self.batch.directions[self.index]
+
+    @property
+    def time(self):
+        return self.batch.times[self.index]
+
+    @property
+    def weight(self):
+        return self.batch.weights[self.index]
+
+class ParticleBatch:
+    __slots__ = ('types', 'positions', 'directions', 'times', 'weights')
+
+    def __init__(self, types, positions, directions, times, weights=None):
+        self.types = np.asarray(types, dtype=np.uint8)
+        self.positions = np.asarray(positions, dtype=float)
+        self.directions = np.asarray(directions, dtype=float)
+        self.times = np.asarray(times, dtype=float)
+        count = len(self.types)
+        self.weights = np.ones(count) if weights is None else np.asarray(weights, dtype=float)
+        if (self.positions.shape != (count, 3) or self.directions.shape != (count, 3)
+                or self.times.shape != (count,) or self.weights.shape != (count,)):
+            raise ValueError("Несогласованные размеры массивов частиц")
+
+    @classmethod
+    def empty(cls, count):
+        return cls(np.zeros(count, dtype=np.uint8), np.empty((count, 3)), np.empty((count, 3)), np.empty(count), np.ones(count))
+
+    @classmethod
+    def from_particles(cls, particles):
+        particles = list(particles)
+        return cls(
+            [PARTICLE_CODES[p.type] for p in particles],
+            np.reshape([p.position for p in particles], (-1, 3)),
+            np.reshape([p.direction for p in particles], (-1, 3)),
+            [p.time for p in particles]
+        )
+
+    @classmethod
+    def concatenate(cls, batches):
+        batches = list(batches)
+        if not batches:
+            return cls.empty(0)
+        return cls(
+            np.concatenate([b.types for b in batches]),
+            np.concatenate([b.positions for b in batches]),
+            np.concatenate([b.directions for b in batches]),
+            np.concatenate([b.times for b in batches]),
+            np.concatenate([b.weights for b in batches])
+        )
+
+    def __len__(self):
+        return len(self.types)
+
+    def __getitem__(self, index):
+        if isinstance(index, (int, np.integer)):
+            if index < 0:
+                index += len(self)
+            if not 0 <= index < len(self):
+                raise IndexError("Индекс частицы вне диапазона")
+            return ParticleView(self, index)
+        # Срезы дают представления numpy без копирования, маски и списки индексов - копии.
+        return ParticleBatch(self.types[index], self.positions[index], self.directions[index], self.times[index], self.weights[index])
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield ParticleView(self, index)
+
+    @property
+    def type_names(self):
+        return np.asarray(PARTICLE_TYPES)[self.types]
+
+    def of_type(self, type):
+        return self[self.types == PARTICLE_CODES[type]]
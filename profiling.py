@@ -0,0 +1,55 @@
+import os
+from time import perf_counter
+from contextlib import nullcontext
+
+NULL_STAGE = nullcontext()
+
+
+class _Stage:
+    __slots__ = ('timer', 'name', 'start')
+
+    def __init__(self, timer, name):
+        self.timer = timer
+        self.name = name
+
+    def __enter__(self):
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.timer.add(self.name, perf_counter() - self.start)
+        return False
+
+
+class StageTimer:
+    # Накопительные таймеры этапов прогона. В выключенном состоянии stage() возвращает
+    # общий пустой контекст, и замеры не стоят ничего, кроме вызова метода.
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.totals = {}
+        self.calls = {}
+
+    def stage(self, name):
+        return _Stage(self, name) if self.enabled else NULL_STAGE
+
+    def add(self, name, seconds, calls=1):
+        self.totals[name] = self.totals.get(name, 0.0) + seconds
+        self.calls[name] = self.calls.get(name, 0) + calls
+
+    def merge(self, other):
+        for name, seconds in other.totals.items():
+            self.add(name, seconds, other.calls[name])
+
+    def report(self):
+        total = sum(self.totals.values())
+        return [
+            (name, self.calls[name], seconds, seconds / total if total else 0.0)
+            for name, seconds in sorted(self.totals.items(), key=lambda item: -item[1])
+        ]
+
+    def write(self, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w', newline='', encoding='utf-8-sig') as f:
+            f.write('Этап;Вызовов;Время_с;Доля\n')
+            f.writelines(f'{name};{calls};{seconds:.6f};{share:.4f}\n' for name, calls, seconds, share in self.report())
+        return path
@@ -0,0 +1,241 @@
+from utils import np
+from particle import PARTICLE_TYPES
+from diagnostics import ColumnBuffer
+from config import MIN_TRACK_LENGTH
+
+# Каждый шаг симуляции выдает блок пересечений в виде словаря колонок:
+# detector (K,), detector_pos (K, 3), time (K,), particle_type (K,) - коды PARTICLE_TYPES,
+# track_length (K,), particle_direction (K, 3), weight (K,).
+# Блоки передаются по цепочке приемников, каждый из которых реализует consume/merge/close.
+
+RESULT_COLUMNS = [
+    ('detector_x', 'f8', '%.6f'),
+    ('detector_y', 'f8', '%.6f'),
+    ('detector_z', 'f8', '%.6f'),
+    ('time', 'f8', '%.6f'),
+    ('particle_type', 'U7', '%s'),
+    ('track_length', 'f8', '%.6f'),
+    ('dir_x', 'f8', '%.2f'),
+    ('dir_y', 'f8', '%.2f'),
+    ('dir_z', 'f8', '%.2f'),
+]
+
+RESULT_HEADER = ['Детектор_X', 'Детектор_Y', 'Детектор_Z', 'Время', 'Тип_частицы', 'Длина_пробега', 'Dir_X', 'Dir_Y', 'Dir_Z']
+
+# Потоковый npz хранит те же плоские колонки, что export.export_binary пишет в parquet и arrow,
+# и читается export.load_columns так же, как экспортированные результаты.
+BINARY_RESULT_COLUMNS = [
+    ('detector', 'i8', '%d'),
+    ('detector_pos_x', 'f8', '%.6f'),
+    ('detector_pos_y', 'f8', '%.6f'),
+    ('detector_pos_z', 'f8', '%.6f'),
+    ('time', 'f8', '%.6f'),
+    ('particle_type', 'U7', '%s'),
+    ('track_length', 'f8', '%.6f'),
+    ('particle_direction_x', 'f8', '%.6f'),
+    ('particle_direction_y', 'f8', '%.6f'),
+    ('particle_direction_z', 'f8', '%.6f'),
+    ('weight', 'f8', '%.6f'),
+]
+
+EMPTY_CHUNK = {
+    'detector': np.empty(0, dtype=np.int64),
+    'detector_pos': np.empty((0, 3)),
+    'time': np.empty(0),
+    'particle_type': np.empty(0, dtype=np.uint8),
+    'track_length': np.empty(0),
+    'particle_direction': np.empty((0, 3)),
+    'weight': np.empty(0),
+}
+
+
+def type_names(particle_types):
+    # Принимает коды PARTICLE_TYPES или имена типов (в том числе строки-объекты pyarrow).
+    particle_types = np.asarray(particle_types)
+    if particle_types.dtype.kind in ('U', 'O'):
+        return particle_types.astype('U7')
+    return np.asarray(PARTICLE_TYPES)[particle_types]
+
+
+class ResultsCollector:
+    # Хранит все блоки в памяти; используется, когда потоковый режим выключен.
+    def __init__(self):
+        self.chunks = []
+        self.saved_chunks = 0
+
+    def consume(self, chunk):
+        if len(chunk['time']):
+            self.chunks.append(chunk)
+
+    def merge(self, other):
+        self.chunks.extend(other.chunks)
+
+    def close(self):
+        pass
+
+    def checkpoint(self):
+        # Только блоки, накопленные с предыдущей контрольной точки.
+        chunks = self.chunks[self.saved_chunks:] or [EMPTY_CHUNK]
+        self.saved_chunks = len(self.chunks)
+        return {key: np.concatenate([chunk[key] for chunk in chunks]) for key in EMPTY_CHUNK}
+
+    def restore(self, state):
+        self.consume(state)
+        self.saved_chunks = len(self.chunks)
+
+    def __len__(self):
+        return sum(len(chunk['time']) for chunk in self.chunks)
+
+    def columns(self):
+        chunks = self.chunks or [EMPTY_CHUNK]
+        return {key: np.concatenate([chunk[key] for chunk in chunks]) for key in EMPTY_CHUNK}
+
+    def records(self):
+        columns = self.columns()
+        return [
+            {
+                'detector_pos': tuple(pos),
+                'time': time,
+                'particle_type': PARTICLE_TYPES[code],
+                'track_length': track_length,
+                'particle_direction': tuple(direction),
+                'weight': weight,
+            }
+            for pos, time, code, track_length, direction, weight in zip(
+                columns['detector_pos'].tolist(), columns['time'].tolist(), columns['particle_type'].tolist(),
+                columns['track_length'].tolist(), columns['particle_direction'].tolist(), columns['weight'].tolist()
+            )
+        ]
+
+
+class DetectorCounters:
+    def __init__(self, num_detectors):
+        self.counts = np.zeros((num_detectors, len(PARTICLE_TYPES)), dtype=np.int64)
+        self.weight_sum = np.zeros(num_detectors)
+        self.track_length_sum = np.zeros(num_detectors)
+        self.short_tracks = np.zeros(num_detectors, dtype=np.int64)
+        self.time_min = np.full(num_detectors, np.inf)
+        self.time_max = np.full(num_detectors, -np.inf)
+
+    def consume(self, chunk):
+        detector = chunk['detector']
+        if not len(detector):
+            return
+        np.add.at(self.counts, (detector, chunk['particle_type']), 1)
+        np.add.at(self.weight_sum, detector, chunk['weight'])
+        np.add.at(self.track_length_sum, detector, chunk['track_length'])
+        np.add.at(self.short_tracks, detector, chunk['track_length'] < MIN_TRACK_LENGTH)
+        np.minimum.at(self.time_min, detector, chunk['time'])
+        np.maximum.at(self.time_max, detector, chunk['time'])
+
+    def merge(self, other):
+        self.counts += other.counts
+        self.weight_sum += other.weight_sum
+        self.track_length_sum += other.track_length_sum
+        self.short_tracks += other.short_tracks
+        np.minimum(self.time_min, other.time_min, out=self.time_min)
+        np.maximum(self.time_max, other.time_max, out=self.time_max)
+
+    def close(self):
+        pass
+
+    def checkpoint(self):
+        # Счетчики имеют фиксированный размер (M строк) и сохраняются целиком.
+        return {name: getattr(self, name).copy() for name in ('counts', 'weight_sum', 'track_length_sum', 'short_tracks', 'time_min', 'time_max')}
+
+    def restore(self, state):
+        for name, value in state.items():
+            getattr(self, name)[...] = value
+
+    @property
+    def total(self):
+        return int(self.counts.sum())
+
+    def count(self, particle_type):
+        return int(self.counts[:, PARTICLE_TYPES.index(particle_type)].sum())
+
+
+def direction_angles(directions):
+    # Полярный угол θ и азимут φ в градусах для массива направлений (K, 3).
+    directions = np.asarray(directions, dtype=float).reshape(-1, 3)
+    theta = np.degrees(np.arctan2(np.hypot(directions[:, 0], directions[:, 1]), directions[:, 2]))
+    phi = np.degrees(np.arctan2(directions[:, 1], directions[:, 0]))
+    return theta, phi
+
+
+class AngularHistogram:
+    # Онлайн-гистограмма направлений: полярный угол θ (0..180°) x азимут φ (-180..180°).
+    def __init__(self, bins=(100, 100)):
+        self.theta_edges = np.linspace(0, 180, bins[0] + 1)
+        self.phi_edges = np.linspace(-180, 180, bins[1] + 1)
+        self.hist = np.zeros(bins)
+        self.saved = np.zeros(bins)
+
+    def consume(self, chunk):
+        directions = chunk['particle_direction']
+        if not len(directions):
+            return
+        theta, phi = direction_angles(directions)
+        self.hist += np.histogram2d(theta, phi, bins=(self.theta_edges, self.phi_edges), weights=chunk['weight'])[0]
+
+    def merge(self, other):
+        self.hist += other.hist
+
+    def close(self):
+        pass
+
+    def checkpoint(self):
+        # Сохраняются только ячейки, изменившиеся с предыдущей контрольной точки.
+        changed = np.flatnonzero(self.hist != self.saved)
+        self.saved = self.hist.copy()
+        return {'index': changed, 'value': self.hist.flat[changed]}
+
+    def restore(self, state):
+        self.hist.flat[state['index']] = state['value']
+        self.saved = self.hist.copy()
+
+
+class ChunkedResultsWriter:
+    def __init__(self, path, fmt='csv', chunk_size=65536):
+        self.binary = fmt != 'csv'
+        columns = BINARY_RESULT_COLUMNS if self.binary else RESULT_COLUMNS
+        self.buffer = ColumnBuffer(path, columns, fmt, chunk_size, header=None if self.binary else RESULT_HEADER, encoding='utf-8-sig')
+
+    def consume(self, chunk):
+        if not len(chunk['time']):
+            return
+        pos = chunk['detector_pos']
+        direction = chunk['particle_direction']
+        if self.binary:
+            self.buffer.append(
+                detector=chunk['detector'],
+                detector_pos_x=pos[:, 0], detector_pos_y=pos[:, 1], detector_pos_z=pos[:, 2],
+                time=chunk['time'],
+                particle_type=type_names(chunk['particle_type']),
+                track_length=chunk['track_length'],
+                particle_direction_x=direction[:, 0], particle_direction_y=direction[:, 1], particle_direction_z=direction[:, 2],
+                weight=chunk['weight'],
+            )
+            return
+        self.buffer.append(
+            detector_x=pos[:, 0], detector_y=pos[:, 1], detector_z=pos[:, 2],
+            time=chunk['time'],
+            particle_type=type_names(chunk['particle_type']),
+            track_length=chunk['track_length'],
+            dir_x=direction[:, 0], dir_y=direction[:, 1], dir_z=direction[:, 2],
+        )
+
+    def merge(self, other):
+        raise ValueError("Потоковые файлы результатов не объединяются")
+
+    def checkpoint(self):
+        return self.buffer.checkpoint()
+
+    def restore(self, state):
+        self.buffer.restore(state)
+
+    def flush(self):
+        self.buffer.flush()
+
+    def close(self):
+        return self.buffer.close()
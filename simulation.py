@@ -1,72 +1,373 @@
 import os
 import json
-import csv
+import shutil
+import logging
 from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
 from utils import np
-from scipy.spatial import cKDTree
 from generator import Generator
-from detector import Detector
-from config import DETECTOR_POSITIONS, DETECTOR_SIZE, SIMULATION_TIME, PARTICLE_SPEED, MIN_TRACK_LENGTH, TRAJECTORY
+from particle import ParticleBatch, PARTICLE_TYPES
+from detector import Detector, calculate_pair_intersections
+from accel import UniformGrid
+from acceptance import AcceptanceTable, acceptance_key
+from matrix import DetectorMatrix
+from diagnostics import Diagnostics, merge_files
+from export import export_columns, output_path
+from profiling import StageTimer
+from checkpoint import CheckpointStore, checkpoint_dir, run_config, config_mismatch
+from log import get_logger, events, get_level, set_level
+from results import ResultsCollector, DetectorCounters, AngularHistogram, ChunkedResultsWriter, type_names
+from config import DETECTOR_POSITIONS, DETECTOR_SIZE, GENERATOR_POSITION, RANDOM_SEED, SIMULATION_TIME, TIME_STEP, WORKERS, NUM_NEUTRONS, NUM_ALPHAS, ACCEPTANCE_SAMPLING, ACCEPTANCE_MEMORY_TABLES, STREAMING_RESULTS, STREAMING_FORMAT, DIAGNOSTICS_FORMAT, DIAGNOSTICS_CHUNK_SIZE, ANGULAR_HISTOGRAM_BINS, PARTICLE_SPEED, MIN_TRACK_LENGTH, TRAJECTORY, PROFILE_STAGES, CHECKPOINT_INTERVAL
+
+logger = get_logger(__name__)
+
 
 class Simulation:
-    def __init__(self):
+    def __init__(self, seed=None, trajectory=None, streaming=None, profile=None):
         if PARTICLE_SPEED <= 0:
             raise ValueError("Скорость частиц должна быть положительной")
         if DETECTOR_SIZE <= 0:
             raise ValueError("Размер детектора должен быть положительным")
         if MIN_TRACK_LENGTH <= 0:
             raise ValueError("Минимальная длина пробега должна быть положительной")
-        self.generator = Generator()
+        self.trajectory = TRAJECTORY if trajectory is None else trajectory
+        if seed is None:
+            seed = RANDOM_SEED
+        self.seed_sequence = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+        self.generator = Generator(GENERATOR_POSITION, self.seed_sequence)
         self.detectors = [Detector(pos, DETECTOR_SIZE) for pos in DETECTOR_POSITIONS]
-        self.detector_positions = np.array([d.position for d in self.detectors])
-        self.kdtree = cKDTree(self.detector_positions)
+        self.matrix = DetectorMatrix(DETECTOR_POSITIONS, DETECTOR_SIZE)
+        self.detector_positions = self.matrix.world_positions
+        self.box_min = self.matrix.box_min
+        self.box_max = self.matrix.box_max
+        self.grid = UniformGrid(self.box_min, self.box_max)
+        self.acceptance_tables = {}
         self.time = 0
-        self.results = []
+        self.streaming = STREAMING_RESULTS if streaming is None else streaming
+        self.collector = None if self.streaming else ResultsCollector()
+        self.counters = DetectorCounters(len(self.detectors))
+        self.histogram = AngularHistogram(ANGULAR_HISTOGRAM_BINS)
+        self.sinks = [sink for sink in (self.collector, self.counters, self.histogram) if sink is not None]
         self.missed_intersections = 0
         self.stitched_results = {}
-        print(f"Симуляция инициализирована с {len(self.detectors)} детекторами")
+        self.diagnostics = None
+        self.writer = None
+        self.checkpoints = None
+        self.checkpoint_interval = CHECKPOINT_INTERVAL
+        self.timer = StageTimer(PROFILE_STAGES if profile is None else profile)
+        logger.info("Симуляция инициализирована с %d детекторами", len(self.detectors))
+
+    @property
+    def results(self):
+        # В потоковом режиме пересечения не хранятся в памяти.
+        return [] if self.collector is None else self.collector.records()
 
     def move_detectors(self, traj_point):
-        pass
-
-    def simulate_particle(self, particle, timestamp):
-        indices = self.kdtree.query_ball_point(particle.position, r=3.0)
-        for idx in indices:
-            detector = self.detectors[idx]
-            detection = detector.calculate_intersection(particle, PARTICLE_SPEED, timestamp)
-            if detection:
-                if np.linalg.norm(detection['direction']) == 0:
-                    print("Направление частицы не может быть нулевым")
-                    continue
-                detector.register_particle(detection)
-                self.results.append({
-                    'detector_pos': tuple(np.round(detector.position, 6)),
-                    'time': detection['time'],
-                    'particle_type': detection['particle_type'],
-                    'track_length': detection['track_length'],
-                    'particle_direction': tuple(detection['direction'])
-                })
-                print(f"Пересечение зарегистрировано: {detection}")
-            else:
-                self.missed_intersections += 1
-
-    def run(self):
-        timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-        time_step = 0.1
-        print(f"Запуск симуляции на {SIMULATION_TIME} секунд с шагом {time_step} с, временной штамп {timestamp}")
-        while self.time < SIMULATION_TIME:
-            traj_point = TRAJECTORY(self.time)
+        translation, tilt = traj_point
+        if not self.matrix.set_pose(translation, tilt):
+            return
+        self.detector_positions = self.matrix.world_positions
+        for detector, position in zip(self.detectors, self.detector_positions):
+            detector.position = position
+
+    def simulate_particle(self, particle):
+        self.simulate_particles(ParticleBatch.from_particles([particle]))
+
+    def simulate_particles(self, particles):
+        if not len(particles):
+            return
+        timer = self.timer
+        with timer.stage('intersect'):
+            # Сетка строится в системе координат матрицы и не перестраивается при её движении.
+            origins, directions = self.matrix.to_local(particles.positions, particles.directions)
+            ray_idx, box_idx = self.grid.candidates(origins, directions)
+            result = calculate_pair_intersections(
+                origins[ray_idx], directions[ray_idx], particles.times[ray_idx],
+                self.box_min[box_idx], self.box_max[box_idx], PARTICLE_SPEED
+            )
+            hit = result['hit']
+            order = np.lexsort((result['t_near'][hit], ray_idx[hit]))
+            hit_pairs = np.nonzero(hit)[0][order]
+            hit_particles = ray_idx[hit_pairs]
+            hit_detectors = box_idx[hit_pairs]
+            track_lengths = result['track_length'][hit_pairs]
+            detection_times = result['time'][hit_pairs]
+            hit_directions = self.matrix.to_world_directions(result['direction'][hit_pairs])
+            self.missed_intersections += len(particles) * len(self.detectors) - len(hit_pairs)
+            events.count('detection', len(hit_pairs))
+
+            chunk = {
+                'detector': hit_detectors,
+                'detector_pos': np.round(self.detector_positions[hit_detectors], 6),
+                'time': detection_times,
+                'particle_type': particles.types[hit_particles],
+                'track_length': track_lengths,
+                'particle_direction': hit_directions,
+                'weight': particles.weights[hit_particles],
+            }
+
+        with timer.stage('sinks'):
+            for sink in self.sinks:
+                sink.consume(chunk)
+
+        if not self.streaming:
+            with timer.stage('register'):
+                self.register_detections(chunk)
+
+        if self.diagnostics is not None and len(hit_particles):
+            with timer.stage('diagnostics'):
+                self.diagnostics.log_intersections(
+                    particles.type_names[hit_particles],
+                    self.detector_positions[hit_detectors],
+                    hit_directions,
+                    track_lengths,
+                    detection_times
+                )
+
+    def register_detections(self, chunk):
+        for k, idx in enumerate(chunk['detector']):
+            track_length = chunk['track_length'][k]
+            detection = {
+                'time': chunk['time'][k],
+                'track_length': track_length,
+                'particle_type': PARTICLE_TYPES[chunk['particle_type'][k]],
+                'direction': chunk['particle_direction'][k],
+                'is_short_track': track_length < MIN_TRACK_LENGTH
+            }
+            self.detectors[idx].register_particle(detection)
+            if events.debug:
+                events.sample('detection', logging.DEBUG, "Пересечение зарегистрировано: %s", detection)
+
+    def step_rng(self, step):
+        # Отдельный поток случайных чисел на каждый шаг: результат не зависит от числа процессов.
+        seed = np.random.SeedSequence(self.seed_sequence.entropy, spawn_key=self.seed_sequence.spawn_key + (step,))
+        return np.random.default_rng(seed)
+
+    def num_steps(self):
+        return int(np.ceil(SIMULATION_TIME / TIME_STEP - 1e-9))
+
+    def acceptance_table(self):
+        key = acceptance_key(self.generator.position, self.matrix)
+        table = self.acceptance_tables.pop(key, None)
+        if table is None:
+            table = AcceptanceTable.cached(self.generator.position, self.matrix)
+            if len(self.acceptance_tables) >= ACCEPTANCE_MEMORY_TABLES:
+                del self.acceptance_tables[next(iter(self.acceptance_tables))]
+        self.acceptance_tables[key] = table
+        return table.oriented(self.matrix)
+
+    def expected_counts(self):
+        # Ожидаемое число пересечений по детекторам за весь прогон без трассировки частиц.
+        counts = np.zeros(len(self.detectors))
+        trajectory = self.matrix.precompute(self.trajectory, [step * TIME_STEP for step in range(self.num_steps())])
+        for traj_point in trajectory:
             self.move_detectors(traj_point)
-            particles = self.generator.emit_particles(self.time, timestamp)
-            for particle in particles:
-                self.simulate_particle(particle, timestamp)
-            self.time += time_step
-        self.stitch_results()
-        neutron_count = sum(1 for r in self.results if r['particle_type'] == 'neutron')
-        alpha_count = sum(1 for r in self.results if r['particle_type'] == 'alpha')
-        print(f"Симуляция завершена. Зарегистрировано {len(self.results)} пересечений: {neutron_count} нейтронов, {alpha_count} альфа-частиц. Пропущено пересечений: {self.missed_intersections}")
+            counts += self.acceptance_table().expected_counts(NUM_NEUTRONS + NUM_ALPHAS)
+        return counts
+
+    def run_steps(self, start, stop):
+        timer = self.timer
+        with timer.stage('trajectory'):
+            trajectory = self.matrix.precompute(self.trajectory, [step * TIME_STEP for step in range(start, stop)])
+        for step, traj_point in zip(range(start, stop), trajectory):
+            self.time = step * TIME_STEP
+            with timer.stage('trajectory'):
+                self.move_detectors(traj_point)
+            acceptance = None
+            if ACCEPTANCE_SAMPLING:
+                with timer.stage('acceptance'):
+                    acceptance = self.acceptance_table()
+            with timer.stage('emit'):
+                particles = self.generator.emit_batch(
+                    self.time, NUM_NEUTRONS, NUM_ALPHAS, self.diagnostics, self.step_rng(step), acceptance
+                )
+            self.simulate_particles(particles)
+            interval = self.checkpoint_interval
+            if self.checkpoints is not None and interval and (step + 1 - start) % interval == 0 and step + 1 < stop:
+                with timer.stage('checkpoint'):
+                    self.checkpoint(step + 1)
+        self.time = stop * TIME_STEP
+
+    def run(self, workers=None, timestamp=None):
+        if timestamp is None:
+            timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+        workers = WORKERS if workers is None else workers
+        if workers < 1:
+            raise ValueError("Число процессов должно быть положительным")
+        num_steps = self.num_steps()
+        logger.info("Запуск симуляции на %s секунд с шагом %s с, временной штамп %s, зерно %s, процессов %d", SIMULATION_TIME, TIME_STEP, timestamp, self.seed_sequence.entropy, workers)
+        events.reset()
+        if self.checkpoint_interval:
+            CheckpointStore(checkpoint_dir(timestamp)).write_manifest({
+                'entropy': self.seed_sequence.entropy,
+                'spawn_key': self.seed_sequence.spawn_key,
+                'streaming': self.streaming,
+                'workers': workers,
+                'num_steps': num_steps,
+                'checkpoint_interval': self.checkpoint_interval,
+                'config': run_config(),
+            })
+        if workers == 1:
+            self.run_range(0, num_steps, timestamp)
+        else:
+            self.run_parallel(num_steps, workers, timestamp)
+        self.finish(timestamp)
         return timestamp
 
+    @classmethod
+    def resume(cls, timestamp, trajectory=None):
+        # Продолжает прерванный прогон с последней контрольной точки; результат совпадает
+        # с непрерывным прогоном при том же config.py и той же траектории.
+        manifest = CheckpointStore(checkpoint_dir(timestamp)).read_manifest()
+        changed = config_mismatch(manifest['config'])
+        if changed:
+            raise ValueError(
+                "Параметры config.py изменились после запуска прогона, продолжение невозможно: " + ', '.join(changed)
+            )
+        seed = np.random.SeedSequence(manifest['entropy'], spawn_key=manifest['spawn_key'])
+        sim = cls(seed=seed, trajectory=trajectory, streaming=manifest['streaming'])
+        sim.checkpoint_interval = manifest.get('checkpoint_interval', 0)
+        workers = manifest['workers']
+        logger.info("Продолжение прогона %s с последней контрольной точки, процессов %d", timestamp, workers)
+        events.reset()
+        if workers == 1:
+            sim.run_range(0, manifest['num_steps'], timestamp, resume=True)
+        else:
+            sim.run_parallel(manifest['num_steps'], workers, timestamp, resume=True)
+        sim.finish(timestamp)
+        return sim
+
+    def finish(self, timestamp):
+        with self.timer.stage('stitch'):
+            self.stitch_results()
+        logger.info(
+            "Симуляция завершена. Зарегистрировано %d пересечений: %d нейтронов, %d альфа-частиц. Пропущено пересечений: %d",
+            self.counters.total, self.counters.count('neutron'), self.counters.count('alpha'), self.missed_intersections
+        )
+        events.summary()
+        self.write_timing(timestamp)
+
+    def write_timing(self, timestamp):
+        if not self.timer.enabled:
+            return None
+        path = self.timer.write(os.path.join('history', timestamp, f'timing_{timestamp}.csv'))
+        logger.info("Отчет о времени этапов сохранен в %s", path)
+        return path
+
+    def run_range(self, start, stop, timestamp, part=None, resume=False):
+        self.diagnostics = Diagnostics(timestamp, DIAGNOSTICS_FORMAT, part=part)
+        writer = None
+        if self.streaming:
+            suffix = timestamp if part is None else f'{timestamp}_part{part}'
+            path = os.path.join('history', timestamp, f'results_{suffix}.{STREAMING_FORMAT}')
+            writer = ChunkedResultsWriter(path, STREAMING_FORMAT, DIAGNOSTICS_CHUNK_SIZE)
+            self.sinks.append(writer)
+        self.writer = writer
+        if self.checkpoint_interval or resume:
+            self.checkpoints = CheckpointStore(checkpoint_dir(timestamp, part))
+            if resume:
+                start = self.restore(start)
+            else:
+                self.checkpoints.clear()
+        completed = False
+        try:
+            self.run_steps(start, stop)
+            if self.checkpoints is not None:
+                self.checkpoint(stop)
+            completed = True
+        finally:
+            # Прерванный прогон только сбрасывает буферы: файлы столбцов npz остаются
+            # на диске до продолжения с контрольной точки.
+            with self.timer.stage('diagnostics'):
+                if completed:
+                    self.diagnostics.close()
+                else:
+                    self.diagnostics.flush()
+            self.diagnostics = None
+            self.writer = None
+            self.checkpoints = None
+            if writer is not None:
+                self.sinks.remove(writer)
+                if completed:
+                    path = writer.close()
+                    if path:
+                        logger.info("Результаты записаны в %s", path)
+                else:
+                    writer.flush()
+
+    def checkpoint_sinks(self):
+        sinks = {'results': self.collector, 'counters': self.counters, 'histogram': self.histogram,
+                 'writer': self.writer, 'diagnostics': self.diagnostics}
+        return {name: sink for name, sink in sinks.items() if sink is not None}
+
+    def checkpoint(self, step):
+        state = {
+            'step': np.int64(step),
+            'missed_intersections': np.int64(self.missed_intersections),
+            'events': json.dumps(dict(events.counts)),
+        }
+        for name, sink in self.checkpoint_sinks().items():
+            state[name] = sink.checkpoint()
+        return self.checkpoints.save(state)
+
+    def restore(self, start):
+        sinks = self.checkpoint_sinks()
+        for state in self.checkpoints.load():
+            for name, sink in sinks.items():
+                sink.restore(state[name])
+            if 'results' in state and not self.streaming:
+                self.register_detections(state['results'])
+            start = int(state['step'])
+            self.missed_intersections = int(state['missed_intersections'])
+            events.counts.clear()
+            events.merge(json.loads(str(state['events'])))
+        logger.info("Состояние восстановлено, продолжение с шага %d", start)
+        return start
+
+    def run_parallel(self, num_steps, workers, timestamp, resume=False):
+        bounds = np.linspace(0, num_steps, min(workers, num_steps) + 1).astype(int)
+        parts = len(bounds) - 1
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(
+                    _run_shard, self.seed_sequence, self.trajectory, self.streaming, self.timer.enabled, self.checkpoint_interval,
+                    int(start), int(stop), timestamp, part, get_level(), resume
+                )
+                for part, (start, stop) in enumerate(zip(bounds[:-1], bounds[1:]))
+            ]
+            for future in futures:
+                sinks, missed, detections, event_counts, timer = future.result()
+                self.timer.merge(timer)
+                for sink, shard_sink in zip(self.sinks, sinks):
+                    sink.merge(shard_sink)
+                self.missed_intersections += missed
+                events.merge(event_counts)
+                for detector, shard_detections in zip(self.detectors, detections):
+                    detector.detections.extend(shard_detections)
+        self.time = num_steps * TIME_STEP
+        # Как и после последовательного прогона, матрица остается в положении последнего шага.
+        if num_steps:
+            self.move_detectors(self.trajectory((num_steps - 1) * TIME_STEP))
+        self.merge_parts(timestamp, parts)
+
+    def merge_parts(self, timestamp, parts):
+        # Файлы диагностики и потоковых результатов частей объединяются в файлы всего прогона.
+        history_path = os.path.join('history', timestamp)
+        names = [f'intersection_log_{{}}.{DIAGNOSTICS_FORMAT}', f'generated_directions_{{}}.{DIAGNOSTICS_FORMAT}']
+        if self.streaming:
+            names.append(f'results_{{}}.{STREAMING_FORMAT}')
+        for name in names:
+            paths = [os.path.join(history_path, name.format(f'{timestamp}_part{part}')) for part in range(parts)]
+            paths = [path for path in paths if os.path.exists(path)]
+            if paths:
+                path = merge_files(paths, os.path.join(history_path, name.format(timestamp)))
+                logger.info("Файлы частей объединены в %s", path)
+
+    def result_columns(self):
+        columns = self.collector.columns() if self.collector is not None else ResultsCollector().columns()
+        columns['particle_type'] = type_names(columns['particle_type'])
+        return columns
+
     def stitch_results(self):
         self.stitched_results = {}
         for result in self.results:
@@ -77,41 +378,39 @@ class Simulation:
                 'time': result['time'],
                 'particle_type': result['particle_type'],
                 'track_length': result['track_length'],
-                'particle_direction': result['particle_direction']
+                'particle_direction': result['particle_direction'],
+                'weight': result['weight']
             })
 
     def export_results(self, filename, timestamp):
+        if self.streaming:
+            logger.info("В потоковом режиме результаты записываются во время прогона, экспорт не требуется")
+            return
         history_path = os.path.join('history', timestamp)
         os.makedirs(history_path, exist_ok=True)
         filepath = os.path.join(history_path, filename)
-        
-        if os.path.exists(filepath):
-            print(f"Файл {filepath} уже существует, создается резервная копия")
-            os.rename(filepath, filepath + '.bak')
-        
-        if filename.endswith('.json'):
-            with open(filepath, 'w', encoding='utf-8') as f:
-                json.dump(self.stitched_results, f, default=lambda x: list(x) if isinstance(x, tuple) else x)
-            print(f"Результаты экспортированы в {filepath} в формате JSON")
-        
-        elif filename.endswith('.csv'):
-            with open(filepath, 'w', newline='', encoding='utf-8-sig') as f:
-                writer = csv.writer(f, delimiter=';')
-                writer.writerow(['Детектор_X', 'Детектор_Y', 'Детектор_Z', 'Время', 'Тип_частицы', 'Длина_пробега', 'Dir_X', 'Dir_Y', 'Dir_Z'])
-                for pos, detections in self.stitched_results.items():
-                    for detection in detections:
-                        writer.writerow([
-                            f"{pos[0]:.6f}",
-                            f"{pos[1]:.6f}",
-                            f"{pos[2]:.6f}",
-                            f"{detection['time']:.6f}",
-                            detection['particle_type'],
-                            f"{detection['track_length']:.6f}",
-                            f"{detection['particle_direction'][0]:.2f}",
-                            f"{detection['particle_direction'][1]:.2f}",
-                            f"{detection['particle_direction'][2]:.2f}"
-                        ])
-            print(f"Результаты экспортированы в {filepath} в формате CSV")
-        
-        else:
-            print("Неподдерживаемый формат файла. Используйте .json или .csv")
+        target = output_path(filepath)
+
+        if os.path.exists(target):
+            logger.info("Файл %s уже существует, создается резервная копия", target)
+            if os.path.isdir(target + '.bak'):
+                shutil.rmtree(target + '.bak')
+            os.rename(target, target + '.bak')
+
+        try:
+            with self.timer.stage('export'):
+                export_columns(self.result_columns(), filepath)
+        except ValueError as e:
+            logger.error("%s", e)
+            return
+        self.write_timing(timestamp)
+        logger.info("Результаты экспортированы в %s в формате %s", target, os.path.splitext(filename)[1][1:].upper())
+
+
+def _run_shard(seed_sequence, trajectory, streaming, profile, checkpoint_interval, start, stop, timestamp, part, log_level, resume):
+    set_level(log_level)
+    events.reset()
+    sim = Simulation(seed=seed_sequence, trajectory=trajectory, streaming=streaming, profile=profile)
+    sim.checkpoint_interval = checkpoint_interval
+    sim.run_range(start, stop, timestamp, part, resume)
+    return sim.sinks, sim.missed_intersections, [d.detections for d in sim.detectors], dict(events.counts), sim.timer
@@ -0,0 +1,118 @@
+import os
+import json
+import hashlib
+from functools import partial
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+from utils import np
+import config
+from simulation import Simulation
+from checkpoint import RESULT_CONFIG_KEYS
+from log import get_logger
+
+logger = get_logger(__name__)
+
+SWEEP_MANIFEST = 'sweep.json'
+
+def static_trajectory(translation, tilt, t):
+    return translation, tilt
+
+
+def point_trajectory(distance, angle):
+    # distance - расстояние от генератора до центра матрицы вдоль оси Z, angle - наклон матрицы.
+    center_z = np.mean([pos[2] for pos in config.DETECTOR_POSITIONS])
+    offset = distance - (center_z - config.GENERATOR_POSITION[2])
+    return partial(static_trajectory, (0.0, 0.0, float(offset)), float(angle))
+
+
+def point_config(distance, angle, seed=None):
+    point = {key: getattr(config, key) for key in RESULT_CONFIG_KEYS}
+    point.update({'distance': float(distance), 'angle': float(angle), 'seed': seed})
+    return point
+
+
+def config_hash(point):
+    return hashlib.sha256(json.dumps(point, sort_keys=True, default=list).encode('utf-8')).hexdigest()
+
+
+def point_simulation(distance, angle, seed=None):
+    # Точка сканирования сохраняет столбцы результатов, поэтому потоковый режим для неё отключен.
+    sim = Simulation(seed=seed, trajectory=point_trajectory(distance, angle), streaming=False)
+    sim.move_detectors(sim.trajectory(0.0))
+    return sim
+
+
+def run_point(point, path, timestamp):
+    sim = point_simulation(point['distance'], point['angle'], point['seed'])
+    sim.run(workers=1, timestamp=timestamp)
+    columns = sim.result_columns()
+    counts = sim.counters.counts.sum(axis=1)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + '.tmp.npz'
+    np.savez(
+        tmp_path, config=json.dumps(point, default=list), missed_intersections=sim.missed_intersections,
+        detector_counts=counts, **columns
+    )
+    os.replace(tmp_path, path)
+    return path
+
+
+def load_point(path):
+    with np.load(path) as data:
+        result = {key: data[key] for key in data.files}
+    result['config'] = json.loads(str(result['config']))
+    result['missed_intersections'] = int(result['missed_intersections'])
+    return result
+
+
+def sweep_seed(cache_dir):
+    # Зерно не задано: случайная энтропия выбирается один раз и сохраняется в манифесте кэша,
+    # так что повторное сканирование находит уже рассчитанные точки.
+    path = os.path.join(cache_dir, SWEEP_MANIFEST)
+    if os.path.exists(path):
+        with open(path, encoding='utf-8') as f:
+            seed = json.load(f)['seed']
+        logger.info("Зерно сканирования не задано, используется сохраненное: %d", seed)
+        return seed
+    seed = np.random.SeedSequence().entropy
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'seed': seed}, f)
+    os.replace(tmp_path, path)
+    logger.info("Зерно сканирования не задано, выбрано случайное и сохранено в %s: %d", path, seed)
+    return seed
+
+
+def run_sweep(distances=None, angles=None, seed=None, workers=None, cache_dir=config.SWEEP_CACHE_DIR):
+    distances = config.DISTANCES if distances is None else distances
+    angles = config.ANGLES if angles is None else angles
+    seed = config.RANDOM_SEED if seed is None else seed
+    if seed is None:
+        seed = sweep_seed(cache_dir)
+    workers = config.WORKERS if workers is None else workers
+    sweep_timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+
+    paths = {}
+    pending = []
+    for distance in distances:
+        for angle in angles:
+            point = point_config(distance, angle, seed)
+            path = os.path.join(cache_dir, f'{config_hash(point)}.npz')
+            paths[(distance, angle)] = path
+            if os.path.exists(path):
+                logger.info("Точка d=%s м, α=%s° загружена из кэша %s", distance, angle, path)
+            else:
+                pending.append((point, path, f'{sweep_timestamp}_d{distance}_a{angle}'))
+
+    logger.info("Сканирование: %d точек, из них к расчету %d, процессов %d", len(paths), len(pending), workers)
+    if workers > 1 and len(pending) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(run_point, *args) for args in pending]
+            for future in futures:
+                logger.info("Точка сканирования сохранена в %s", future.result())
+    else:
+        for args in pending:
+            logger.info("Точка сканирования сохранена в %s", run_point(*args))
+
+    return {key: load_point(path) for key, path in paths.items()}
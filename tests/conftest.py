@@ -0,0 +1,12 @@
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(autouse=True)
+def workdir(tmp_path, monkeypatch):
+    # Прогоны пишут в history/ и cache/ относительно текущего каталога.
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
@@ -0,0 +1,40 @@
+from utils import np
+from accel import UniformGrid
+from detector import ray_box_intersections
+
+
+def brute_force(origins, directions, box_min, box_max):
+    hit, t_near, _ = ray_box_intersections(origins[:, None, :], directions[:, None, :], box_min[None], box_max[None])
+    ray_idx, box_idx = np.nonzero(hit)
+    order = np.lexsort((t_near[ray_idx, box_idx], ray_idx))
+    return ray_idx[order], box_idx[order]
+
+
+def test_query_matches_brute_force():
+    rng = np.random.default_rng(3)
+    centers = np.array([(x * 0.5, y * 0.5, 0.8) for x in range(6) for y in range(6)])
+    centers += rng.uniform(-0.05, 0.05, centers.shape)
+    box_min, box_max = centers - 0.2, centers + 0.2
+    origins = rng.uniform(-0.5, 3.0, (2000, 3))
+    directions = rng.normal(size=(2000, 3))
+    directions /= np.linalg.norm(directions, axis=1, keepdims=True)
+    # Лучи вдоль осей проверяют обработку параллельных граней.
+    directions[:50] = np.eye(3)[rng.integers(0, 3, 50)] * rng.choice([-1, 1], (50, 1))
+
+    ray_idx, box_idx, _, _ = UniformGrid(box_min, box_max).query(origins, directions)
+    expected_rays, expected_boxes = brute_force(origins, directions, box_min, box_max)
+    assert len(expected_rays) > 0
+    assert np.array_equal(ray_idx, expected_rays)
+    assert np.array_equal(box_idx, expected_boxes)
+
+
+def test_query_drops_degenerate_directions():
+    box_min = np.array([[0.0, 0.0, 0.5], [0.5, 0.0, 0.5]])
+    grid = UniformGrid(box_min, box_min + 0.5)
+    # Начало луча внутри сетки: без отбора обход 3D-DDA не завершался.
+    origins = np.array([[0.3, 0.3, 0.8], [0.3, 0.3, 0.8], [0.3, 0.3, 0.0]])
+    directions = np.array([[0.0, 0.0, 0.0], [1e-9, 0.0, 0.0], [0.0, 0.0, 1.0]])
+    ray_idx, box_idx, _, _ = grid.query(origins, directions)
+    expected_rays, expected_boxes = brute_force(origins, directions, grid.box_min, grid.box_max)
+    assert ray_idx.tolist() == expected_rays.tolist() == [2]
+    assert box_idx.tolist() == expected_boxes.tolist() == [0]
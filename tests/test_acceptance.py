@@ -0,0 +1,37 @@
+from utils import np
+from acceptance import AcceptanceTable
+from detector import calculate_intersections
+from generator import Generator
+from matrix import DetectorMatrix
+from config import DETECTOR_POSITIONS, DETECTOR_SIZE, GENERATOR_POSITION, PARTICLE_SPEED
+
+COUNT = 20000
+
+
+def isotropic_hits(matrix, seed):
+    # Изотропный прогон без таблицы: средние пересечения на частицу по детекторам.
+    particles = Generator(GENERATOR_POSITION, seed).emit_batch(0.0, COUNT, 0)
+    origins, directions = matrix.to_local(particles.positions, particles.directions)
+    result = calculate_intersections(origins, directions, particles.times, matrix.box_min, matrix.box_max, PARTICLE_SPEED)
+    return result['hit'].sum(axis=0) / COUNT
+
+
+def test_expected_counts_match_isotropic_run():
+    for pose, seed in (((np.zeros(3), 0.0), 1), (((0.1, -0.05, 0.2), 25.0), 2)):
+        matrix = DetectorMatrix(DETECTOR_POSITIONS, DETECTOR_SIZE)
+        matrix.set_pose(*pose)
+        expected = AcceptanceTable.build(GENERATOR_POSITION, matrix).expected_counts(1)
+        hits = isotropic_hits(matrix, seed)
+        assert abs(expected.sum() - hits.sum()) < 0.02
+        assert np.allclose(expected, hits, atol=0.01)
+
+
+def test_weighted_sampling_is_unbiased():
+    matrix = DetectorMatrix(DETECTOR_POSITIONS, DETECTOR_SIZE)
+    matrix.set_pose((0.0, 0.03, 0.1), 15.0)
+    table = AcceptanceTable.build(GENERATOR_POSITION, matrix).oriented(matrix)
+    particles = Generator(GENERATOR_POSITION, 3).emit_batch(0.0, COUNT, COUNT // 2, acceptance=table)
+    origins, directions = matrix.to_local(particles.positions, particles.directions)
+    result = calculate_intersections(origins, directions, particles.times, matrix.box_min, matrix.box_max, PARTICLE_SPEED)
+    weighted = (result['hit'] * particles.weights[:, None]).sum() / len(particles)
+    assert abs(weighted - table.expected_counts(1).sum()) < 0.02
@@ -0,0 +1,56 @@
+import os
+import pytest
+from utils import np
+from simulation import Simulation
+
+SEED = 7
+
+
+class Interrupted(Exception):
+    pass
+
+
+def interrupted_run(timestamp, interval, stop_after, **kwargs):
+    sim = Simulation(seed=SEED, **kwargs)
+    sim.checkpoint_interval = interval
+    run_steps = sim.run_steps
+
+    def run_steps_then_fail(start, stop):
+        run_steps(start, min(stop, start + stop_after))
+        raise Interrupted()
+
+    sim.run_steps = run_steps_then_fail
+    with pytest.raises(Interrupted):
+        sim.run(workers=1, timestamp=timestamp)
+
+
+def read_files(timestamp):
+    history_path = os.path.join('history', timestamp)
+    files = {}
+    for name in sorted(os.listdir(history_path)):
+        if name.endswith('.csv'):
+            with open(os.path.join(history_path, name), encoding='utf-8-sig') as f:
+                files[name.replace(timestamp, '')] = f.read()
+    return files
+
+
+@pytest.mark.parametrize('streaming', [False, True])
+def test_resumed_run_equals_full_run(streaming):
+    interrupted_run('resumed', interval=10, stop_after=35, streaming=streaming)
+    resumed = Simulation.resume('resumed')
+
+    full = Simulation(seed=SEED, streaming=streaming)
+    full.run(workers=1, timestamp='full')
+
+    assert np.array_equal(resumed.counters.counts, full.counters.counts)
+    assert np.array_equal(resumed.histogram.hist, full.histogram.hist)
+    assert resumed.missed_intersections == full.missed_intersections
+    expected, actual = full.result_columns(), resumed.result_columns()
+    for name in expected:
+        assert np.array_equal(actual[name], expected[name])
+    assert read_files('resumed') == read_files('full')
+
+
+def test_resume_without_manifest_fails():
+    with pytest.raises(ValueError):
+        Simulation.resume('missing')
@@ -0,0 +1,88 @@
+import os
+import pytest
+from utils import np
+from coincidence import Coincidences
+
+WINDOW = 0.01
+BINS = 20
+
+
+def random_columns(rng, count, num_detectors):
+    return {
+        'time': np.round(rng.uniform(0, 1, count), 4),
+        'detector': rng.integers(0, num_detectors, count),
+        'particle_type': rng.choice(['neutron', 'alpha'], count),
+    }
+
+
+def brute_force(columns, num_detectors, pair_types=None):
+    edges = np.linspace(-WINDOW, WINDOW, BINS + 1)
+    counts = np.zeros((num_detectors, num_detectors), dtype=np.int64)
+    hist = np.zeros((num_detectors, num_detectors, BINS), dtype=np.int64)
+    times, detectors, types = columns['time'], columns['detector'], columns['particle_type']
+    for i in range(len(times)):
+        for j in range(len(times)):
+            if i == j or (times[j], j) < (times[i], i) or times[j] > times[i] + WINDOW:
+                continue
+            if pair_types is not None and sorted((types[i], types[j])) != sorted(pair_types):
+                continue
+            a, b = sorted((detectors[i], detectors[j]))
+            dt = times[j] - times[i] if detectors[i] <= detectors[j] else times[i] - times[j]
+            counts[a, b] += 1
+            hist[a, b, min(max(np.searchsorted(edges, dt, side='right') - 1, 0), BINS - 1)] += 1
+    return counts, hist
+
+
+@pytest.mark.parametrize('pair_types', [None, ('neutron', 'alpha'), ('alpha', 'alpha')])
+@pytest.mark.parametrize('block_size', [7, 1000000])
+def test_find_matches_pairwise_count(pair_types, block_size):
+    rng = np.random.default_rng(4)
+    num_detectors = 5
+    columns = random_columns(rng, 300, num_detectors)
+    counts, hist = brute_force(columns, num_detectors, pair_types)
+
+    coincidences = Coincidences(num_detectors, WINDOW, BINS).find(columns, pair_types, block_size)
+    assert coincidences.total == counts.sum() > 0
+    for (a, b), count, row in zip(coincidences.pairs, coincidences.counts, coincidences.hist):
+        assert count == counts[a, b] == coincidences.count(b, a)
+        assert np.array_equal(row, hist[a, b])
+    assert len(coincidences.pairs) == np.count_nonzero(counts)
+
+
+def test_find_rejects_unknown_pair_types():
+    columns = random_columns(np.random.default_rng(5), 10, 2)
+    with pytest.raises(ValueError):
+        Coincidences(2, WINDOW, BINS).find(columns, ('neutron', 'proton'))
+
+
+def test_streamed_run_gives_same_coincidences(monkeypatch):
+    import simulation
+    from main import run_columns
+    from coincidence import find_coincidences
+    monkeypatch.setattr(simulation, 'STREAMING_FORMAT', 'npz')
+    memory = simulation.Simulation(seed=6)
+    memory.run_range(0, 20, 'memory')
+    streamed = simulation.Simulation(seed=6, streaming=True)
+    streamed.run_range(0, 20, 'streamed')
+
+    expected = find_coincidences(run_columns(memory, 'memory'), len(memory.detectors))
+    actual = find_coincidences(run_columns(streamed, 'streamed'), len(streamed.detectors))
+    assert expected.total > 0
+    assert actual.total == expected.total
+    assert np.array_equal(actual.pairs, expected.pairs)
+    assert np.array_equal(actual.counts, expected.counts)
+    assert np.array_equal(actual.hist, expected.hist)
+
+
+def test_streamed_text_results_and_empty_runs_are_rejected(monkeypatch):
+    import simulation
+    from main import run_columns, save_coincidences
+    monkeypatch.setattr(simulation, 'STREAMING_FORMAT', 'csv')
+    sim = simulation.Simulation(seed=6, streaming=True)
+    sim.run_range(0, 2, 'streamed')
+    with pytest.raises(ValueError):
+        run_columns(sim, 'streamed')
+    empty = {'time': np.empty(0), 'detector': np.empty(0, dtype=int), 'particle_type': np.empty(0, dtype=str)}
+    with pytest.raises(ValueError):
+        save_coincidences(empty, 4, 'empty')
+    assert not os.path.exists(os.path.join('history', 'empty'))
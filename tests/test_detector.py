@@ -0,0 +1,98 @@
+from utils import np
+from particle import Particle
+from detector import Detector, calculate_intersections, calculate_pair_intersections
+
+SPEED = 1.5
+
+
+def reference_intersection(origin, direction, time, box_min, box_max, speed):
+    # Прежний расчет по одной паре частица-детектор (цикл по осям с методом плит).
+    norm = np.linalg.norm(direction)
+    if norm < 1e-8:
+        return None
+    direction = direction / norm
+    t_min = np.full(3, -np.inf)
+    t_max = np.full(3, np.inf)
+    for i in range(3):
+        if abs(direction[i]) < 1e-8:
+            if origin[i] < box_min[i] or origin[i] > box_max[i]:
+                return None
+            continue
+        t1 = (box_min[i] - origin[i]) / direction[i]
+        t2 = (box_max[i] - origin[i]) / direction[i]
+        t_min[i] = min(t1, t2)
+        t_max[i] = max(t1, t2)
+    t_near = np.max(t_min)
+    t_far = np.min(t_max)
+    if t_near > t_far or t_near < 0:
+        return None
+    detection_time = time + t_near / speed
+    if detection_time < 0:
+        return None
+    track_length = np.linalg.norm(direction * t_far - direction * t_near)
+    return detection_time, track_length, direction
+
+
+def random_rays(rng, count):
+    origins = rng.uniform(-1, 1, (count, 3))
+    directions = rng.normal(size=(count, 3))
+    # Лучи вдоль осей, вырожденные направления и отрицательные времена проверяют особые ветви.
+    directions[:40] = np.eye(3)[rng.integers(0, 3, 40)] * rng.choice([-1, 1], (40, 1))
+    directions[40:45] = 0
+    times = rng.uniform(-0.5, 1, count)
+    return origins, directions, times
+
+
+def test_batch_matches_reference_loop():
+    rng = np.random.default_rng(1)
+    box_min = rng.uniform(-1, 0.5, (30, 3))
+    box_max = box_min + 0.5
+    origins, directions, times = random_rays(rng, 1000)
+
+    batch = calculate_intersections(origins, directions, times, box_min, box_max, SPEED)
+    hits = 0
+    for i in range(len(origins)):
+        for j in range(len(box_min)):
+            expected = reference_intersection(origins[i], directions[i], times[i], box_min[j], box_max[j], SPEED)
+            assert (expected is not None) == batch['hit'][i, j]
+            if expected is not None:
+                hits += 1
+                time, track_length, direction = expected
+                assert np.isclose(batch['time'][i, j], time)
+                assert np.isclose(batch['track_length'][i, j], track_length)
+                assert np.allclose(batch['direction'][i], direction)
+    assert hits > 0
+
+
+def test_detector_matches_reference_loop():
+    rng = np.random.default_rng(5)
+    detectors = [Detector(position, 0.5) for position in rng.uniform(-1, 1, (6, 3))]
+    origins, directions, times = random_rays(rng, 300)
+    # Particle не принимает нулевое направление.
+    for origin, direction, time in zip(origins[45:], directions[45:], times[45:]):
+        particle = Particle('neutron', origin, direction, time)
+        for detector in detectors:
+            detection = detector.calculate_intersection(particle, SPEED)
+            expected = reference_intersection(origin, direction, time, detector.box_min, detector.box_max, SPEED)
+            assert (detection is None) == (expected is None)
+            if detection is not None:
+                assert np.isclose(detection['time'], expected[0])
+                assert np.isclose(detection['track_length'], expected[1])
+
+
+def test_pair_intersections_match_matrix():
+    rng = np.random.default_rng(2)
+    box_min = rng.uniform(-1, 0.5, (5, 3))
+    box_max = box_min + 0.5
+    origins, directions, times = random_rays(rng, 200)
+
+    matrix = calculate_intersections(origins, directions, times, box_min, box_max, SPEED)
+    ray_idx, box_idx = np.meshgrid(np.arange(len(origins)), np.arange(len(box_min)), indexing='ij')
+    ray_idx, box_idx = ray_idx.ravel(), box_idx.ravel()
+    pairs = calculate_pair_intersections(
+        origins[ray_idx], directions[ray_idx], times[ray_idx], box_min[box_idx], box_max[box_idx], SPEED
+    )
+    assert np.array_equal(pairs['hit'], matrix['hit'].ravel())
+    hit = pairs['hit']
+    for name in ('time', 'track_length', 't_near', 't_far'):
+        assert np.array_equal(pairs[name][hit], matrix[name].ravel()[hit])
@@ -0,0 +1,49 @@
+import os
+import pytest
+from utils import np
+import simulation
+from simulation import Simulation
+from export import export_columns, load_columns, load_run
+
+BINARY = ('npz', 'npy')
+
+
+@pytest.fixture
+def columns():
+    sim = Simulation(seed=11)
+    sim.run_range(0, 20, 'export')
+    return sim.result_columns()
+
+
+def assert_same(actual, expected):
+    assert sorted(actual) == sorted(expected)
+    for name, values in expected.items():
+        assert np.array_equal(np.asarray(actual[name]), values)
+
+
+@pytest.mark.parametrize('fmt', BINARY)
+def test_binary_round_trip(columns, fmt):
+    path = os.path.join('history', 'run', f'results_run.{fmt}')
+    os.makedirs(os.path.dirname(path))
+    export_columns(columns, path)
+    assert_same(load_columns(path), columns)
+    assert_same(load_run('run'), columns)
+
+
+def test_streamed_npz_matches_export(columns, monkeypatch):
+    monkeypatch.setattr(simulation, 'STREAMING_FORMAT', 'npz')
+    sim = Simulation(seed=11, streaming=True)
+    sim.run_range(0, 20, 'streamed')
+    assert_same(load_run('streamed'), columns)
+
+
+def test_export_results_backs_up_column_directory():
+    sim = Simulation(seed=11)
+    sim.run_range(0, 5, 'backup')
+    sim.export_results('results_backup.npy', 'backup')
+    sim.export_results('results_backup.npy', 'backup')
+    sim.export_results('results_backup.npy', 'backup')
+    history_path = os.path.join('history', 'backup')
+    assert os.path.isdir(os.path.join(history_path, 'results_backup'))
+    assert os.path.isdir(os.path.join(history_path, 'results_backup.bak'))
+    assert not os.path.exists(os.path.join(history_path, 'results_backup.npy'))
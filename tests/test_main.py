@@ -0,0 +1,40 @@
+import os
+import json
+import pytest
+import config
+import main
+
+
+def test_collect_overrides_parses_literals(tmp_path):
+    path = tmp_path / 'overrides.json'
+    path.write_text(json.dumps({'NUM_NEUTRONS': 3, 'TIME_STEP': 0.5}), encoding='utf-8')
+    overrides = main.collect_overrides(
+        [str(path)], ['NUM_NEUTRONS=20', 'STREAMING_FORMAT=npz', 'TRAJECTORY_VELOCITY=(0, 0, 0.1)']
+    )
+    assert overrides == {
+        'NUM_NEUTRONS': 20, 'TIME_STEP': 0.5, 'STREAMING_FORMAT': 'npz', 'TRAJECTORY_VELOCITY': (0, 0, 0.1),
+    }
+
+
+@pytest.mark.parametrize('pair', ['NUM_NEUTRONS', 'UNKNOWN=1', 'num_neutrons=1', 'TRAJECTORY=1', 'CONFIG_OVERRIDES_ENV=x'])
+def test_collect_overrides_rejects_invalid_pairs(pair):
+    with pytest.raises(ValueError):
+        main.collect_overrides([], [pair])
+
+
+def test_apply_overrides_reaches_child_processes(monkeypatch):
+    monkeypatch.setenv(config.CONFIG_OVERRIDES_ENV, json.dumps({'NUM_ALPHAS': 2}))
+    monkeypatch.setattr(config, 'NUM_NEUTRONS', config.NUM_NEUTRONS)
+    main.apply_overrides({'NUM_NEUTRONS': 7})
+    assert config.NUM_NEUTRONS == 7
+    assert json.loads(os.environ[config.CONFIG_OVERRIDES_ENV]) == {'NUM_ALPHAS': 2, 'NUM_NEUTRONS': 7}
+
+
+def test_plot_without_binary_results_is_a_usage_error(workdir, capsys):
+    (workdir / 'history' / 'run').mkdir(parents=True)
+    (workdir / 'history' / 'run' / 'results_run.csv').write_text('', encoding='utf-8')
+    for argv in (['plot', 'run'], ['plot', 'run', '--source', 'results_run.csv']):
+        with pytest.raises(SystemExit) as error:
+            main.main(argv)
+        assert error.value.code == 2
+        assert 'бинарн' in capsys.readouterr().err
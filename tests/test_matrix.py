@@ -0,0 +1,84 @@
+import pytest
+from utils import np
+from config import DETECTOR_POSITIONS, DETECTOR_SIZE, PARTICLE_SPEED
+from particle import ParticleBatch
+from simulation import Simulation
+
+POSES = [
+    ((0.0, 0.0, 0.0), 0.0),
+    ((0.3, -0.2, 0.5), 0.0),
+    ((0.0, 0.0, 0.0), 30.0),
+    ((-0.4, 0.1, 0.25), -65.0),
+    ((0.2, 0.2, -0.3), 90.0),
+]
+
+
+def tilt_rotation(tilt):
+    # Поворот вокруг оси Y, записанный явно, независимо от matrix.rotation_matrices.
+    angle = np.deg2rad(tilt)
+    cos, sin = np.cos(angle), np.sin(angle)
+    return np.array([[cos, 0.0, sin], [0.0, 1.0, 0.0], [-sin, 0.0, cos]])
+
+
+def world_centers(translation, tilt):
+    local = np.array(DETECTOR_POSITIONS, dtype=float)
+    pivot = local.mean(axis=0)
+    return (local - pivot) @ tilt_rotation(tilt).T + pivot + np.asarray(translation)
+
+
+def oriented_box_hits(origins, directions, times, translation, tilt):
+    # Перебор всех пар луч-детектор: метод плит вдоль повернутых осей коробки в мировой системе.
+    rotation = tilt_rotation(tilt)
+    centers = world_centers(translation, tilt)
+    half = DETECTOR_SIZE / 2
+    hits = []
+    for i in range(len(origins)):
+        direction = directions[i] / np.linalg.norm(directions[i])
+        for j, center in enumerate(centers):
+            t_near, t_far = -np.inf, np.inf
+            for axis in rotation.T:
+                offset = np.dot(origins[i] - center, axis)
+                speed = np.dot(direction, axis)
+                if abs(speed) < 1e-8:
+                    if abs(offset) > half:
+                        break
+                    continue
+                t1, t2 = (-half - offset) / speed, (half - offset) / speed
+                t_near, t_far = max(t_near, min(t1, t2)), min(t_far, max(t1, t2))
+            else:
+                if t_near <= t_far and t_near >= 0:
+                    hits.append((i, t_near, j, times[i] + t_near / PARTICLE_SPEED, t_far - t_near, direction))
+    hits.sort(key=lambda hit: hit[:2])
+    return hits
+
+
+def aimed_rays(rng, count, translation, tilt):
+    # Половина лучей нацелена в окрестность повернутых детекторов, остальные случайны.
+    centers = world_centers(translation, tilt)
+    origins = rng.uniform(-2, 2, (count, 3)) + centers.mean(axis=0)
+    targets = centers[rng.integers(0, len(centers), count)] + rng.uniform(-0.3, 0.3, (count, 3))
+    directions = targets - origins
+    directions[count // 2:] = rng.normal(size=(count - count // 2, 3))
+    times = np.arange(count, dtype=float)
+    return origins, directions, times
+
+
+@pytest.mark.parametrize('translation, tilt', POSES)
+def test_moved_matrix_matches_oriented_boxes(translation, tilt):
+    rng = np.random.default_rng(11)
+    sim = Simulation(seed=1)
+    # Сначала матрица проходит через другое положение: сетка не должна зависеть от истории движения.
+    sim.move_detectors(((0.1, 0.1, 0.1), 15.0))
+    sim.move_detectors((translation, tilt))
+    origins, directions, times = aimed_rays(rng, 400, translation, tilt)
+    sim.simulate_particles(ParticleBatch(np.zeros(len(origins)), origins, directions, times))
+
+    expected = oriented_box_hits(origins, directions, times, translation, tilt)
+    columns = sim.collector.columns()
+    assert len(expected) > 50
+    assert np.array_equal(columns['detector'], [hit[2] for hit in expected])
+    assert np.allclose(columns['time'], [hit[3] for hit in expected])
+    assert np.allclose(columns['track_length'], [hit[4] for hit in expected])
+    assert np.allclose(columns['particle_direction'], [hit[5] for hit in expected])
+    assert np.allclose(columns['detector_pos'], world_centers(translation, tilt)[columns['detector']], atol=1e-6)
+    assert sim.missed_intersections == len(origins) * len(DETECTOR_POSITIONS) - len(expected)
@@ -0,0 +1,51 @@
+import os
+import pytest
+from utils import np
+import simulation
+from simulation import Simulation
+
+SEED = 9
+
+
+def moving(t):
+    return (0.0, 0.02 * t, 0.05 * t), 3.0 * t
+
+
+def history_files(timestamp):
+    history_path = os.path.join('history', timestamp)
+    files = {}
+    for name in sorted(os.listdir(history_path)):
+        with open(os.path.join(history_path, name), 'rb') as f:
+            files[name.replace(timestamp, '')] = f.read()
+    return files
+
+
+@pytest.mark.parametrize('fmt', ['csv', 'npz'])
+def test_parallel_run_equals_serial(fmt, monkeypatch):
+    monkeypatch.setattr(simulation, 'STREAMING_FORMAT', fmt)
+    monkeypatch.setattr(simulation, 'DIAGNOSTICS_FORMAT', fmt)
+    monkeypatch.setattr(simulation, 'SIMULATION_TIME', 2.0)
+    serial = Simulation(seed=SEED, trajectory=moving, streaming=True)
+    serial.run(workers=1, timestamp='serial')
+    parallel = Simulation(seed=SEED, trajectory=moving, streaming=True)
+    parallel.run(workers=3, timestamp='parallel')
+
+    assert serial.counters.counts.sum() > 0
+    assert np.array_equal(parallel.counters.counts, serial.counters.counts)
+    assert np.array_equal(parallel.histogram.hist, serial.histogram.hist)
+    assert parallel.missed_intersections == serial.missed_intersections
+    assert np.array_equal(parallel.matrix.world_positions, serial.matrix.world_positions)
+    assert all(np.array_equal(a.position, b.position) for a, b in zip(parallel.detectors, serial.detectors))
+    # Файлы частей объединены и совпадают с файлами последовательного прогона байт в байт.
+    assert history_files('parallel') == history_files('serial')
+
+
+def test_parallel_collects_results_in_order(monkeypatch):
+    monkeypatch.setattr(simulation, 'SIMULATION_TIME', 2.0)
+    serial = Simulation(seed=SEED, trajectory=moving)
+    serial.run(workers=1, timestamp='serial')
+    parallel = Simulation(seed=SEED, trajectory=moving)
+    parallel.run(workers=2, timestamp='parallel')
+    expected, actual = serial.result_columns(), parallel.result_columns()
+    for name in expected:
+        assert np.array_equal(actual[name], expected[name])
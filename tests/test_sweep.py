@@ -0,0 +1,12 @@
+import os
+from sweep import run_sweep, SWEEP_MANIFEST
+
+
+def test_unseeded_sweep_reuses_cached_points():
+    first = run_sweep([0.5], [30.0], workers=1, cache_dir='cache')
+    files = sorted(os.listdir('cache'))
+    second = run_sweep([0.5], [30.0], workers=1, cache_dir='cache')
+    assert SWEEP_MANIFEST in files and len(files) == 2
+    assert sorted(os.listdir('cache')) == files
+    for name in ('time', 'detector_counts'):
+        assert (first[(0.5, 30.0)][name] == second[(0.5, 30.0)][name]).all()
@@ -1,37 +1,63 @@
 import os
+from concurrent.futures import ProcessPoolExecutor
+import matplotlib
+from config import PLOT_HEADLESS, PLOT_DPI, PLOT_WORKERS
+if PLOT_HEADLESS:
+    matplotlib.use('Agg')
 import matplotlib.pyplot as plt
 from matplotlib.colors import LinearSegmentedColormap, Normalize
+from mpl_toolkits.mplot3d.art3d import Line3DCollection
 from utils import np
+from particle import ParticleBatch
+from results import AngularHistogram, direction_angles
+from log import get_logger
 
-def visualize_3d(detectors, generator_pos, particles, timestamp, distance, angle):
-    if not particles:
-        print("Нет частиц для визуализации")
+logger = get_logger(__name__)
+
+# Ребра куба как пары вершин, отличающихся одной координатой (вершины нумеруются битами x, y, z).
+CORNER_OFFSETS = np.array([[(i >> 2) & 1, (i >> 1) & 1, i & 1] for i in range(8)], dtype=float) - 0.5
+BOX_EDGES = np.array([(a, a | bit) for a in range(8) for bit in (1, 2, 4) if not a & bit])
+
+
+def box_segments(matrix):
+    # Отрезки (M * 12, 2, 3) для всех ребер всех детекторов: вершины строятся в системе
+    # координат матрицы и переводятся в мировую с учетом её наклона.
+    corners = matrix.local_positions[:, None, :] + CORNER_OFFSETS[None, :, :] * matrix.size
+    return matrix.to_world(corners[:, BOX_EDGES].reshape(-1, 3)).reshape(-1, 2, 3)
+
+
+def track_segments(particles, length=2.0):
+    return np.stack([particles.positions, particles.positions + particles.directions * length], axis=1)
+
+def visualize_3d(matrix, generator_pos, particles, timestamp, distance, angle, dpi=PLOT_DPI):
+    if not isinstance(particles, ParticleBatch):
+        particles = ParticleBatch.from_particles(particles)
+    if not len(particles):
+        logger.info("Нет частиц для визуализации")
         return
     
     try:
         fig = plt.figure(figsize=(10, 8))
         ax = fig.add_subplot(111, projection='3d')
         
-        for detector in detectors:
-            pos = detector.position
-            size = detector.size
-            x = [pos[0] - size/2, pos[0] + size/2]
-            y = [pos[1] - size/2, pos[1] + size/2]
-            z = [pos[2] - size/2, pos[2] + size/2]
-            for i in range(2):
-                for j in range(2):
-                    ax.plot3D([x[i], x[i]], [y[j], y[j]], [z[0], z[1]], 'b')
-                    ax.plot3D([x[i], x[i]], [y[0], y[1]], [z[j], z[j]], 'b')
-                    ax.plot3D([x[0], x[1]], [y[i], y[i]], [z[j], z[j]], 'b')
-        
+        boxes = box_segments(matrix)
+        ax.add_collection3d(Line3DCollection(boxes, colors='b', linewidths=1))
+
         ax.scatter(generator_pos[0], generator_pos[1], generator_pos[2], c='r', marker='*', s=200, label='Генератор')
-        
-        for particle in particles:
-            start = np.array(particle.position)
-            direction = np.array(particle.direction)
-            end = start + direction * 2.0
-            ax.plot3D([start[0], end[0]], [start[1], end[1]], [start[2], end[2]], 'g' if particle.type == 'neutron' else 'm', label=particle.type if particle == particles[0] else '')
-        
+
+        # Траектории рисуются одной коллекцией на тип частицы; оси подгоняются вручную,
+        # так как add_collection3d не меняет пределы.
+        segments = track_segments(particles)
+        for particle_type, color in (('neutron', 'g'), ('alpha', 'm')):
+            mask = particles.type_names == particle_type
+            if np.any(mask):
+                ax.add_collection3d(Line3DCollection(segments[mask], colors=color, linewidths=1, label=particle_type))
+        points = np.concatenate([segments.reshape(-1, 3), boxes.reshape(-1, 3), [generator_pos]])
+        lower, upper = points.min(axis=0), points.max(axis=0)
+        ax.set_xlim(lower[0], upper[0])
+        ax.set_ylim(lower[1], upper[1])
+        ax.set_zlim(lower[2], upper[2])
+
         ax.set_xlabel('X, м')
         ax.set_ylabel('Y, м')
         ax.set_zlabel('Z, м')
@@ -42,40 +68,42 @@ def visualize_3d(detectors, generator_pos, particles, timestamp, distance, angle
         os.makedirs(history_path, exist_ok=True)
         filepath = os.path.join(history_path, f'3d_visualization_d{distance}_a{angle}_{timestamp}.png')
         try:
-            plt.savefig(filepath, dpi=600, bbox_inches='tight')
-            print(f"3D визуализация сохранена в {filepath}")
+            plt.savefig(filepath, dpi=dpi, bbox_inches='tight')
+            logger.info("3D визуализация сохранена в %s", filepath)
         except PermissionError as e:
-            print(f"Ошибка записи файла {filepath}: Отказано в доступе ({e}). Визуализация не сохранена.")
+            logger.error("Ошибка записи файла %s: Отказано в доступе (%s). Визуализация не сохранена.", filepath, e)
         plt.close()
     except Exception as e:
-        print(f"Ошибка при визуализации 3D: {e}")
+        logger.error("Ошибка при визуализации 3D: %s", e)
 
-def visualize_angular_distribution(results, timestamp):
-    if not results:
-        print("Нет данных для визуализации углового распределения")
+def visualize_angular_distribution(results, timestamp, dpi=PLOT_DPI):
+    # results - список пересечений либо накопленная во время прогона AngularHistogram.
+    if isinstance(results, AngularHistogram):
+        if not results.hist.any():
+            logger.info("Нет данных для визуализации углового распределения")
+            return
+    elif not results:
+        logger.info("Нет данных для визуализации углового распределения")
         return
     
     try:
-        theta_angles = []
-        phi_angles = []
-        for result in results:
-            dir_x, dir_y, dir_z = result['particle_direction']
-            theta = np.arctan2(np.sqrt(dir_x**2 + dir_y**2), dir_z) * 180 / np.pi
-            phi = np.arctan2(dir_y, dir_x) * 180 / np.pi
-            theta_angles.append(theta)
-            phi_angles.append(phi)
-        
-        if not theta_angles or not phi_angles:
-            print("Нет углов для визуализации")
-            return
+        if isinstance(results, AngularHistogram):
+            hist, xedges, yedges = results.hist.copy(), results.theta_edges, results.phi_edges
+        else:
+            theta_angles, phi_angles = direction_angles([result['particle_direction'] for result in results])
+
+            if not len(theta_angles):
+                logger.info("Нет углов для визуализации")
+                return
+
+            hist, xedges, yedges = np.histogram2d(theta_angles, phi_angles, bins=(100, 100), range=((0, 180), (-180, 180)), density=True)
         
         plt.figure(figsize=(12, 10))
         cmap = LinearSegmentedColormap.from_list('custom', ['#0000FF', '#00FFFF', '#FFFF00', '#FF0000'], N=256)
-        hist, xedges, yedges = np.histogram2d(theta_angles, phi_angles, bins=(100, 100), range=((0, 180), (-180, 180)), density=True)
         hist_max = np.max(hist)
-        print(f"Максимальное значение плотности: {hist_max}")
+        logger.info("Максимальное значение плотности: %s", hist_max)
         if hist_max == 0:
-            print("Гистограмма пуста или содержит нулевые значения")
+            logger.info("Гистограмма пуста или содержит нулевые значения")
             hist = np.zeros_like(hist)
         else:
             hist /= hist_max
@@ -98,10 +126,21 @@ def visualize_angular_distribution(results, timestamp):
         os.makedirs(history_path, exist_ok=True)
         filepath = os.path.join(history_path, f'angular_distribution_{timestamp}.png')
         try:
-            plt.savefig(filepath, dpi=600, bbox_inches='tight')
-            print(f"Тепловая карта углового распределения сохранена в {filepath}")
+            plt.savefig(filepath, dpi=dpi, bbox_inches='tight')
+            logger.info("Тепловая карта углового распределения сохранена в %s", filepath)
         except PermissionError as e:
-            print(f"Ошибка записи файла {filepath}: Отказано в доступе ({e}). Визуализация не сохранена.")
+            logger.error("Ошибка записи файла %s: Отказано в доступе (%s). Визуализация не сохранена.", filepath, e)
         plt.close()
     except Exception as e:
-        print(f"Ошибка при визуализации углового распределения: {e}")
+        logger.error("Ошибка при визуализации углового распределения: %s", e)
+
+
+def render_figures(jobs, workers=PLOT_WORKERS):
+    # jobs - список (функция, аргументы); при workers > 1 каждая фигура рисуется в отдельном процессе.
+    if workers > 1 and len(jobs) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for future in [executor.submit(function, *args) for function, args in jobs]:
+                future.result()
+    else:
+        for function, args in jobs:
+            function(*args)